@@ -6,16 +6,33 @@ import json
 import base64
 import tempfile
 import uuid
-from datetime import datetime
-from collections import defaultdict
-
+import math
+import hashlib
+import queue
+import threading
+import time
+import difflib
+import atexit
+import html
+import multiprocessing
+import random
+import zlib
+import sqlite3
+from datetime import datetime, timedelta
+from collections import defaultdict, deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import click
 from flask import (
-    Flask, request, redirect, url_for, render_template_string,
-    session, send_file, flash
+    Flask, request, redirect, url_for, render_template,
+    session, send_file, flash, jsonify, abort, Request, Response
 )
 
 # --- CHANGED: server-side sessions via filesystem
 from flask_session import Session
+from flask_session.base import ServerSideSessionInterface
+from markupsafe import Markup
 
 # ===== Optional heavy deps handled gracefully =====
 try:
@@ -24,9 +41,15 @@ except Exception:
     fitz = None
 
 try:
-    from pdf2image import convert_from_bytes
+    from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
+except Exception:
+    convert_from_bytes = convert_from_path = None
+    pdfinfo_from_bytes = pdfinfo_from_path = None
+
+try:
+    import zstandard as zstd
 except Exception:
-    convert_from_bytes = None
+    zstd = None
 
 # ===== Google Cloud Vision (OCR) =====
 USE_MOCK = os.getenv("USE_MOCK", "0") == "1"
@@ -49,19 +72,200 @@ if not USE_MOCK:
 
 # ===== Flask app =====
 app = Flask(__name__)
-app.config["MAX_CONTENT_LENGTH"] = 25 * 1024 * 1024  # 25MB PDF limit
+# Uploads are spooled to disk (see UploadSpool), so this bounds disk use rather than memory
+app.config["MAX_CONTENT_LENGTH"] = int(float(os.getenv("UPLOAD_MAX_MB", "25")) * 1024 * 1024)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", os.urandom(16))
 
-# --- CHANGED: Flask-Session filesystem configuration
-app.config["SESSION_TYPE"] = "filesystem"
-app.config["SESSION_FILE_DIR"] = os.path.join(tempfile.gettempdir(), "flask_sessions")
+# --- CHANGED: Flask-Session configuration (backend chosen by SESSION_BACKEND below)
 app.config["SESSION_PERMANENT"] = False
 app.config["SESSION_USE_SIGNER"] = True
 app.config["SESSION_COOKIE_HTTPONLY"] = True
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 # In production behind HTTPS, uncomment:
 # app.config["SESSION_COOKIE_SECURE"] = True
-Session(app)
+
+# ===== Sessions =====
+# filesystem: Flask-Session files in the temp dir (single node, payloads stored inline)
+# sqlite:     one SQLite file with an indexed expiry column, swept every ~N requests
+# redis:      any Redis-protocol server; expiry is native, so sessions can be shared across nodes
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "filesystem").lower()
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH", os.path.join(tempfile.gettempdir(), "syllascan_sessions.sqlite3"))
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_CLEANUP_N_REQUESTS = int(os.getenv("SESSION_CLEANUP_N_REQUESTS", "200"))
+
+# Session keys whose values are kept out of the session record in the sqlite/redis backends;
+# the session only holds a content hash (see session_put_payload / session_payload).
+PAYLOAD_REFS_KEY = "payload_refs"
+
+app.permanent_session_lifetime = timedelta(seconds=SESSION_TTL_SECONDS)
+
+def _payload_ref(value) -> tuple:
+    data = json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(data).hexdigest(), data
+
+class SQLiteSessionInterface(ServerSideSessionInterface):
+    """Sessions and their payloads in one SQLite file; expired rows are removed by an indexed delete."""
+
+    ttl = False
+
+    def __init__(self, app, path: str, cleanup_n_requests: int = 0):
+        self.path = path
+        self._local = threading.local()
+        db = self._db()
+        db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, data BLOB NOT NULL, expiry REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expiry);
+            CREATE TABLE IF NOT EXISTS payloads (ref TEXT PRIMARY KEY, data BLOB NOT NULL, expiry REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS payloads_expiry ON payloads (expiry);
+        """)
+        super().__init__(
+            app,
+            key_prefix=app.config.get("SESSION_KEY_PREFIX", "session:"),
+            use_signer=app.config["SESSION_USE_SIGNER"],
+            permanent=app.config["SESSION_PERMANENT"],
+            cleanup_n_requests=cleanup_n_requests or None,
+        )
+
+    def _db(self):
+        # One connection per thread, reopened in forked workers
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _retrieve_session_data(self, store_id: str):
+        row = self._db().execute(
+            "SELECT data FROM sessions WHERE id = ? AND expiry > ?", (store_id, time.time())
+        ).fetchone()
+        return self.serializer.decode(row[0]) if row else None
+
+    def _delete_session(self, store_id: str) -> None:
+        self._db().execute("DELETE FROM sessions WHERE id = ?", (store_id,))
+
+    def _upsert_session(self, session_lifetime, session, store_id: str) -> None:
+        expiry = time.time() + session_lifetime.total_seconds()
+        refs = list((session.get(PAYLOAD_REFS_KEY) or {}).values())
+        db = self._db()
+        with db:
+            db.execute("BEGIN")
+            db.execute(
+                "INSERT INTO sessions (id, data, expiry) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET data = excluded.data, expiry = excluded.expiry",
+                (store_id, self.serializer.encode(session), expiry),
+            )
+            # Payloads live as long as the longest-lived session that references them
+            db.executemany(
+                "UPDATE payloads SET expiry = max(expiry, ?) WHERE ref = ?", [(expiry, r) for r in refs]
+            )
+
+    def _delete_expired_sessions(self) -> None:
+        now = time.time()
+        db = self._db()
+        with db:
+            db.execute("BEGIN")
+            db.execute("DELETE FROM sessions WHERE expiry <= ?", (now,))
+            db.execute("DELETE FROM payloads WHERE expiry <= ?", (now,))
+
+    def put_payload(self, value) -> str:
+        ref, data = _payload_ref(value)
+        self._db().execute(
+            "INSERT INTO payloads (ref, data, expiry) VALUES (?, ?, ?) "
+            "ON CONFLICT (ref) DO UPDATE SET expiry = max(expiry, excluded.expiry)",
+            (ref, data, time.time() + SESSION_TTL_SECONDS),
+        )
+        return ref
+
+    def get_payload(self, ref: str):
+        row = self._db().execute("SELECT data FROM payloads WHERE ref = ?", (ref,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+def _redis_session_interface(app):
+    import redis
+    from flask_session.redis import RedisSessionInterface
+
+    class RedisRefSessionInterface(RedisSessionInterface):
+        """Flask-Session's Redis store plus content-addressed payloads under the same TTL."""
+
+        def _payload_key(self, ref: str) -> str:
+            return f"{self.key_prefix}payload:{ref}"
+
+        def _upsert_session(self, session_lifetime, session, store_id: str) -> None:
+            super()._upsert_session(session_lifetime, session, store_id)
+            refs = list((session.get(PAYLOAD_REFS_KEY) or {}).values())
+            if refs:
+                pipe = self.client.pipeline(transaction=False)
+                for ref in refs:
+                    pipe.expire(self._payload_key(ref), session_lifetime)
+                pipe.execute()
+
+        def put_payload(self, value) -> str:
+            ref, data = _payload_ref(value)
+            self.client.set(self._payload_key(ref), data, ex=SESSION_TTL_SECONDS)
+            return ref
+
+        def get_payload(self, ref: str):
+            data = self.client.get(self._payload_key(ref))
+            return json.loads(data) if data else None
+
+    client = app.config.get("SESSION_REDIS") or redis.Redis.from_url(SESSION_REDIS_URL)
+    return RedisRefSessionInterface(
+        app,
+        client=client,
+        key_prefix=app.config.get("SESSION_KEY_PREFIX", "session:"),
+        use_signer=app.config["SESSION_USE_SIGNER"],
+        permanent=app.config["SESSION_PERMANENT"],
+    )
+
+def init_sessions(app):
+    if SESSION_BACKEND == "sqlite":
+        app.session_interface = SQLiteSessionInterface(app, SESSION_SQLITE_PATH, SESSION_CLEANUP_N_REQUESTS)
+    elif SESSION_BACKEND == "redis":
+        app.session_interface = _redis_session_interface(app)
+    elif SESSION_BACKEND == "filesystem":
+        app.config["SESSION_TYPE"] = "filesystem"
+        app.config["SESSION_FILE_DIR"] = os.path.join(tempfile.gettempdir(), "flask_sessions")
+        Session(app)
+    else:
+        raise RuntimeError(f"Unknown SESSION_BACKEND {SESSION_BACKEND!r}; use filesystem, sqlite or redis.")
+
+init_sessions(app)
+
+# Payloads are immutable (keyed by content hash), so decoded copies can be shared freely
+_payload_memo = OrderedDict()
+_payload_memo_lock = threading.Lock()
+
+def session_put_payload(name: str, value):
+    """Store a large session value, keeping only its reference in the session when the backend supports it."""
+    iface = app.session_interface
+    if value is None or not hasattr(iface, "put_payload"):
+        session[name] = value
+        return
+    refs = dict(session.get(PAYLOAD_REFS_KEY) or {})
+    refs[name] = iface.put_payload(value)
+    session[PAYLOAD_REFS_KEY] = refs
+    session.pop(name, None)
+
+def session_payload(name: str, default=None):
+    ref = (session.get(PAYLOAD_REFS_KEY) or {}).get(name)
+    if ref is None:
+        return session.get(name, default)
+    with _payload_memo_lock:
+        if ref in _payload_memo:
+            _payload_memo.move_to_end(ref)
+            return _payload_memo[ref]
+    value = app.session_interface.get_payload(ref)
+    if value is None:
+        return default
+    with _payload_memo_lock:
+        _payload_memo[ref] = value
+        while len(_payload_memo) > 64:
+            _payload_memo.popitem(last=False)
+    return value
 
 # ====== Basic HTML (single-file app) ======
 PAGE = """ 
@@ -233,10 +437,17 @@ PAGE = """
       <section class="card">
         <h2>Upload PDF</h2>
         <p class="muted">OCR with Vision → extract policies & schedule with Gemini.</p>
-        <form method="POST" action="{{ url_for('upload') }}" enctype="multipart/form-data" class="form-row">
+        <form id="upload-form" method="POST" action="{{ url_for('upload') }}" data-precheck="{{ url_for('upload_precheck') }}" enctype="multipart/form-data" class="form-row">
           <input class="input" type="file" name="pdf" accept="application/pdf" required aria-label="Choose PDF" />
           <button class="btn" type="submit">Process</button>
         </form>
+        <div id="upload-status" class="muted" style="margin-top:8px" role="status" aria-live="polite" hidden></div>
+        {% if job_id %}
+          <div id="job" class="alert" style="margin-top:10px" data-job="{{ job_id }}" role="status" aria-live="polite">
+            <div id="job-text">Processing in background…</div>
+            <progress id="job-bar" style="width:100%" max="1"></progress>
+          </div>
+        {% endif %}
         {% if syllabus_summary %}
           <details class="disclosure" style="margin-top:10px" open>
             <summary>Auto Summary</summary>
@@ -248,36 +459,15 @@ PAGE = """
       <!-- Ask -->
       <section class="card">
         <h2>Ask a Question</h2>
-        <form method="POST" action="{{ url_for('ask') }}" class="form-row">
+        <form id="ask-form" method="POST" action="{{ url_for('ask') }}" data-stream="{{ url_for('ask_stream') }}" class="form-row">
           <input class="input" type="text" name="question" placeholder="Late policy? Attendance?" required />
-          <button class="btn" type="submit" {% if not syllabus_text %}disabled aria-disabled="true"{% endif %}>Ask</button>
+          <button class="btn" type="submit" {% if not has_text %}disabled aria-disabled="true"{% endif %}>Ask</button>
         </form>
-        {% if answer %}
-          <div class="muted" style="margin-top:8px"><strong>Answer:</strong> {{ answer }}</div>
-        {% endif %}
+        <div id="answer" class="muted" style="margin-top:8px" aria-live="polite" {% if not answer %}hidden{% endif %}><strong>Answer:</strong> <span id="answer-text">{{ answer or '' }}</span></div>
       </section>
 
       <!-- FAQs (compact, always visible) -->
-      {% if faq %}
-      <section class="card">
-        <h2>FAQs</h2>
-
-        <div class="faq-list">
-          <div class="faq-item">
-            <h3>📌 Late Work</h3>
-            <div class="muted">{{ faq.get('late_work_policy','—') }}</div>
-          </div>
-          <div class="faq-item">
-            <h3>🧍 Attendance</h3>
-            <div class="muted">{{ faq.get('attendance_policy','—') }}</div>
-          </div>
-          <div class="faq-item">
-            <h3>🏗️ Structure</h3>
-            <div class="muted">{{ faq.get('course_structure','—') }}</div>
-          </div>
-        </div>
-      </section>
-      {% endif %}
+      {{ fragments.faq }}
     </aside>
 
     <!-- RIGHT: content with tabs (keeps page short) -->
@@ -297,12 +487,12 @@ PAGE = """
           <div class="charts">
             <div class="chart-card">
               <h3>Cumulative Grade %</h3>
-              <img class="chart" src="{{ url_for('chart_weights') }}" alt="Cumulative grade percentage by week" />
+              <img class="chart" src="{{ url_for('chart_weights', v=chart_v) }}" alt="Cumulative grade percentage by week" />
               <p class="muted">How much of the final grade is determined by each week cumulatively.</p>
             </div>
             <div class="chart-card">
               <h3>Assignments per Week</h3>
-              <img class="chart" src="{{ url_for('chart_assignments') }}" alt="Assignments per week" />
+              <img class="chart" src="{{ url_for('chart_assignments', v=chart_v) }}" alt="Assignments per week" />
               <p class="muted">Count of graded items by week.</p>
             </div>
           </div>
@@ -313,52 +503,21 @@ PAGE = """
 
         <!-- Pane: SCHEDULE TABLE -->
         <section id="schedule" class="pane" role="tabpanel" hidden>
-          {% if schedule %}
-          <div class="table-wrap" aria-label="Schedule table">
-            <table>
-              <thead>
-                <tr>
-                  <th style="width:80px">Week</th>
-                  <th style="width:140px"># Assignments</th>
-                  <th style="width:140px">Weight (%)</th>
-                  <th>Notes</th>
-                </tr>
-              </thead>
-              <tbody>
-                {% for item in schedule %}
-                <tr>
-                  <td>{{ item.week }}</td>
-                  <td>{{ item.assignments }}</td>
-                  <td>{{ '%.1f'|format(item.weight_pct|float) }}</td>
-                  <td class="muted">{{ item.notes }}</td>
-                </tr>
-                {% endfor %}
-              </tbody>
-            </table>
-          </div>
-          {% else %}
-            <p class="muted">No schedule yet.</p>
-          {% endif %}
+          {{ fragments.schedule_table }}
         </section>
 
         <!-- Pane: RAW JSON -->
         <section id="json" class="pane" role="tabpanel" hidden>
-          {% if schedule %}
-            <details class="code" open>
-              <summary><strong>Structured Schedule JSON</strong></summary>
-              <pre>{{ schedule|tojson(indent=2) }}</pre>
-            </details>
-          {% else %}
-            <p class="muted">Upload a syllabus to generate JSON.</p>
-          {% endif %}
+          {{ fragments.schedule_json }}
         </section>
 
         <!-- Pane: OCR TEXT -->
         <section id="ocr" class="pane" role="tabpanel" hidden>
-          {% if syllabus_text %}
+          {% if has_text %}
             <details class="code" open>
-              <summary><strong>Raw OCR Text</strong></summary>
-              <pre>{{ syllabus_text }}</pre>
+              <summary><strong>Raw OCR Text</strong> <span id="ocr-status" class="muted"></span></summary>
+              <pre id="ocr-text" data-src="{{ url_for('ocr_text') }}"></pre>
+              <button id="ocr-more" class="btn" type="button" hidden>Load more pages</button>
             </details>
           {% else %}
             <p class="muted">No OCR text yet.</p>
@@ -378,7 +537,34 @@ PAGE = """
       tabs.forEach(t => t.setAttribute('aria-selected', (t.getAttribute('href')===id) ? 'true' : 'false'));
       // Persist chosen tab in hash
       if(location.hash !== id){ history.replaceState(null, '', id); }
+      if(id === '#ocr' && ocrNext === 1) loadOcr();
+    }
+
+    // OCR pane: fetched a few pages at a time when first opened, not inlined in the page.
+    const ocrPre = document.getElementById('ocr-text');
+    const ocrMore = document.getElementById('ocr-more');
+    const ocrStatus = document.getElementById('ocr-status');
+    let ocrNext = ocrPre ? 1 : null, ocrBusy = false;
+    async function loadOcr(){
+      if(ocrBusy || ocrNext === null) return;
+      ocrBusy = true; ocrMore.disabled = true;
+      try{
+        const resp = await fetch(`${ocrPre.dataset.src}?page=${ocrNext}`, {headers:{'Accept':'application/json'}});
+        const data = await resp.json();
+        if(!resp.ok) throw new Error(data.error || resp.status);
+        const text = data.pages.map(p => p.text).join('\\n\\f');
+        ocrPre.textContent += (ocrPre.textContent ? '\\n\\f' : '') + text;
+        const shown = data.page + data.pages.length - 1;
+        ocrStatus.textContent = `(pages 1–${shown} of ${data.total_pages})`;
+        ocrNext = data.next_page;
+        ocrMore.hidden = ocrNext === null;
+      }catch(err){
+        ocrStatus.textContent = `(could not load: ${err.message})`;
+      }finally{
+        ocrBusy = false; ocrMore.disabled = false;
+      }
     }
+    if(ocrMore) ocrMore.addEventListener('click', loadOcr);
     // Init
     const initial = location.hash && panes.find(p => '#'+p.id===location.hash) ? location.hash : '#charts';
     show(initial);
@@ -392,13 +578,659 @@ PAGE = """
       const next = (i + dir + tabs.length) % tabs.length;
       tabs[next].focus(); tabs[next].click();
     });
+
+    // Ask: stream the answer in place; fall back to the normal form POST.
+    const askForm = document.getElementById('ask-form');
+    if(askForm && window.fetch && window.ReadableStream && window.TextDecoder){
+      const box = document.getElementById('answer');
+      const out = document.getElementById('answer-text');
+      const btn = askForm.querySelector('button');
+      askForm.addEventListener('submit', async (e) => {
+        e.preventDefault();
+        let got = false;
+        btn.disabled = true; box.hidden = false; out.textContent = '…';
+        try{
+          const resp = await fetch(askForm.dataset.stream, {method:'POST', body:new FormData(askForm), headers:{'Accept':'text/event-stream'}});
+          if(!resp.ok || !resp.body) throw new Error(resp.status);
+          const reader = resp.body.getReader(), dec = new TextDecoder();
+          let buf = '';
+          for(;;){
+            const {value, done} = await reader.read();
+            if(done) break;
+            buf += dec.decode(value, {stream:true});
+            let cut;
+            while((cut = buf.indexOf('\\n\\n')) >= 0){
+              const msg = buf.slice(0, cut); buf = buf.slice(cut + 2);
+              const name = (msg.match(/^event: (.*)$/m) || [])[1] || 'message';
+              const data = JSON.parse((msg.match(/^data: (.*)$/m) || [])[1] || '{}');
+              if(name === 'message'){ if(!got){ out.textContent = ''; got = true; } out.textContent += data.text; }
+              else if(name === 'error'){ out.textContent = data.error; got = true; }
+            }
+          }
+          if(!got) throw new Error('empty');
+        }catch(err){
+          if(!got){ askForm.submit(); return; }
+        }finally{
+          btn.disabled = false;
+        }
+      });
+    }
+
+    // Upload: send the SHA-256 first (cached syllabi skip the transfer), then resumable
+    // checksummed chunks. Needs crypto.subtle (HTTPS or localhost); otherwise a plain form POST.
+    const upForm = document.getElementById('upload-form');
+    if(upForm && window.fetch && window.crypto && crypto.subtle){
+      const upStatus = document.getElementById('upload-status');
+      const hex = (buf) => [...new Uint8Array(buf)].map(b => b.toString(16).padStart(2, '0')).join('');
+      const sleep = (ms) => new Promise(r => setTimeout(r, ms));
+      upForm.addEventListener('submit', async (e) => {
+        const file = upForm.querySelector('input[type=file]').files[0];
+        if(!file) return;
+        e.preventDefault();
+        upForm.querySelector('button').disabled = true;
+        upStatus.hidden = false;
+        try{
+          upStatus.textContent = 'Checking…';
+          const digest = hex(await crypto.subtle.digest('SHA-256', await file.arrayBuffer()));
+          const precheck = async () => {
+            const r = await fetch(upForm.dataset.precheck, {
+              method:'POST',
+              headers:{'Content-Type':'application/json', 'Accept':'application/json'},
+              body:JSON.stringify({sha256:digest, size:file.size, filename:file.name}),
+            });
+            const d = await r.json();
+            if(!r.ok) throw new Error(d.error || r.status);
+            return d;
+          };
+          let resp, data = await precheck();
+          if(data.status === 'upload'){
+            let {url, chunk_size, offset} = data, failures = 0, restarts = 0;
+            while(data.status === 'upload'){
+              const last = offset + chunk_size >= file.size;
+              upStatus.textContent = last ? 'Processing…' : `Uploading… ${Math.floor(offset * 100 / file.size)}%`;
+              const chunk = await file.slice(offset, offset + chunk_size).arrayBuffer();
+              try{
+                resp = await fetch(`${url}?offset=${offset}`, {
+                  method:'PUT',
+                  body:chunk,
+                  headers:{'Content-Type':'application/octet-stream', 'Accept':'application/json',
+                           'X-Chunk-SHA256':hex(await crypto.subtle.digest('SHA-256', chunk))},
+                });
+              }catch(err){
+                // Dropped connection: retry the same chunk with backoff.
+                if(++failures > 5) throw err;
+                upStatus.textContent = 'Connection lost, retrying…';
+                await sleep(1000 * 2 ** failures);
+                continue;
+              }
+              data = await resp.json().catch(() => ({}));
+              if(resp.status === 410 && data.status === 'restart'){
+                // The assembled file failed its SHA-256 check and was discarded: start over once.
+                if(++restarts > 1) throw new Error(data.error || resp.status);
+                data = await precheck();
+                if(data.status !== 'upload') break;
+                ({url, chunk_size, offset} = data);
+                failures = 0;
+                continue;
+              }
+              if(resp.status === 409 || resp.status === 422){
+                // Server has a different offset (or rejected the chunk): resume from what it reports.
+                if(++failures > 5) throw new Error(data.error || resp.status);
+                offset = data.offset; data.status = 'upload';
+                continue;
+              }
+              if(!resp.ok) throw new Error(data.error || resp.status);
+              failures = 0;
+              offset = data.offset;
+            }
+          }
+          location.assign(data.redirect || location.pathname);
+        }catch(err){
+          upStatus.textContent = `Upload failed (${err.message}); sending it as a regular upload…`;
+          upForm.submit();
+        }
+      });
+    }
+
+    // Background upload job: follow progress, then load results into the session.
+    const jobBox = document.getElementById('job');
+    if(jobBox){
+      const id = jobBox.dataset.job;
+      const text = document.getElementById('job-text');
+      const bar = document.getElementById('job-bar');
+      let finished = false;
+      const render = (s) => {
+        const p = s.progress || {};
+        if(p.stage === 'ocr'){
+          const total = p.page_count || 0, done = (p.text_layer_pages || 0) + (p.pages_ocrd || 0);
+          text.textContent = `OCR: ${p.pages || 0} page(s) rendered, ${done}${total ? ' / ' + total : ''} read`;
+          if(total){ bar.max = total; bar.value = done; }
+        } else if(p.stage === 'extracting'){
+          text.textContent = 'Extracting policies & schedule…';
+          bar.removeAttribute('value');
+        } else if(p.stage === 'queued'){
+          text.textContent = 'Queued…';
+        }
+        if((s.state === 'done' || s.state === 'error') && !finished){
+          finished = true;
+          fetch(`/jobs/${id}/load`, {method:'POST', headers:{'Accept':'application/json'}})
+            .finally(() => location.reload());
+        }
+      };
+      // The job is gone (server restart, JOB_TTL_SECONDS, or another worker): stop instead of reloading.
+      const gone = () => {
+        text.textContent = 'This upload is no longer being processed. Please upload the PDF again.';
+        bar.hidden = true;
+      };
+      if(window.EventSource){
+        const es = new EventSource(`/jobs/${id}/events`);
+        es.onmessage = (e) => { const s = JSON.parse(e.data); render(s); if(finished) es.close(); };
+        es.onerror = () => {
+          es.close();
+          if(finished) return;
+          const retry = () => setTimeout(() => location.reload(), 2000);
+          fetch(`/jobs/${id}`).then(r => { if(r.status === 404) gone(); else retry(); }, retry);
+        };
+      } else {
+        const poll = () => fetch(`/jobs/${id}`).then(r => {
+          if(r.status === 404) return gone();
+          return r.json().then(s => { render(s); if(!finished) setTimeout(poll, 1000); });
+        });
+        poll();
+      }
+    }
   </script>
 </body>
 </html>
 
 """
+
+# Per-syllabus pieces of PAGE. They only change on upload, so they are rendered
+# once per content hash and dropped into the page as-is (see dashboard_fragments).
+FAQ_FRAGMENT = """
+      {% if faq %}
+      <section class="card">
+        <h2>FAQs</h2>
+
+        <div class="faq-list">
+          <div class="faq-item">
+            <h3>📌 Late Work</h3>
+            <div class="muted">{{ faq.get('late_work_policy','—') }}</div>
+          </div>
+          <div class="faq-item">
+            <h3>🧍 Attendance</h3>
+            <div class="muted">{{ faq.get('attendance_policy','—') }}</div>
+          </div>
+          <div class="faq-item">
+            <h3>🏗️ Structure</h3>
+            <div class="muted">{{ faq.get('course_structure','—') }}</div>
+          </div>
+        </div>
+      </section>
+      {% endif %}
+"""
+
+SCHEDULE_TABLE_FRAGMENT = """
+          {% if schedule %}
+          <div class="table-wrap" aria-label="Schedule table">
+            <table>
+              <thead>
+                <tr>
+                  <th style="width:80px">Week</th>
+                  <th style="width:140px"># Assignments</th>
+                  <th style="width:140px">Weight (%)</th>
+                  <th>Notes</th>
+                </tr>
+              </thead>
+              <tbody>
+                {% for item in schedule %}
+                <tr>
+                  <td>{{ item.week }}</td>
+                  <td>{{ item.assignments }}</td>
+                  <td>{{ '%.1f'|format(item.weight_pct|float) }}</td>
+                  <td class="muted">{{ item.notes }}</td>
+                </tr>
+                {% endfor %}
+              </tbody>
+            </table>
+          </div>
+          {% else %}
+            <p class="muted">No schedule yet.</p>
+          {% endif %}
+"""
+
+SCHEDULE_JSON_FRAGMENT = """
+          {% if schedule %}
+            <details class="code" open>
+              <summary><strong>Structured Schedule JSON</strong></summary>
+              <pre>{{ schedule|tojson(indent=2) }}</pre>
+            </details>
+          {% else %}
+            <p class="muted">Upload a syllabus to generate JSON.</p>
+          {% endif %}
+"""
+
+# Compiled once at import; render_template_string would re-parse PAGE on every GET.
+PAGE_TEMPLATE = app.jinja_env.from_string(PAGE)
+FRAGMENT_TEMPLATES = {
+    "faq": (app.jinja_env.from_string(FAQ_FRAGMENT), "faq"),
+    "schedule_table": (app.jinja_env.from_string(SCHEDULE_TABLE_FRAGMENT), "schedule"),
+    "schedule_json": (app.jinja_env.from_string(SCHEDULE_JSON_FRAGMENT), "schedule"),
+}
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "256"))
+
+_fragment_cache = OrderedDict()  # (name, content hash) -> Markup
+_fragment_cache_lock = threading.Lock()
+
+def _render_fragment(name: str, value):
+    template, var = FRAGMENT_TEMPLATES[name]
+    digest = hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    key = (name, digest)
+    with _fragment_cache_lock:
+        html_ = _fragment_cache.get(key)
+        if html_ is not None:
+            _fragment_cache.move_to_end(key)
+            return html_
+    html_ = Markup(template.render(**{var: value}))
+    with _fragment_cache_lock:
+        _fragment_cache[key] = html_
+        while len(_fragment_cache) > FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+    return html_
+
+def dashboard_fragments(faq, schedule) -> dict:
+    """Rendered FAQ cards, schedule table and schedule JSON for the current syllabus."""
+    return {
+        "faq": _render_fragment("faq", faq),
+        "schedule_table": _render_fragment("schedule_table", schedule),
+        "schedule_json": _render_fragment("schedule_json", schedule),
+    }
+
+# ===== On-disk caches =====
+CACHE_DIR = os.getenv("SYLLASCAN_CACHE_DIR", os.path.join(tempfile.gettempdir(), "syllascan_cache"))
+
+
+class DiskLRUCache:
+    """
+    Size-bounded text cache stored as one file per key.
+    Recency is tracked with file atimes and age with mtimes, so entries survive
+    restarts and are shared by every worker process on the host.
+    max_bytes <= 0 disables it; ttl_seconds <= 0 means entries never expire.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl_seconds: int = 0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def _expired(self, mtime: float) -> bool:
+        return self.ttl_seconds > 0 and time.time() - mtime > self.ttl_seconds
+
+    def _entries(self):
+        """(atime, size, path, key, mtime) for every entry."""
+        try:
+            it = os.scandir(self.directory)
+        except FileNotFoundError:
+            return []
+        entries = []
+        with it:
+            for e in it:
+                if not e.name.endswith(".txt"):
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_atime, st.st_size, e.path, e.name[:-4], st.st_mtime))
+        return entries
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            mtime = os.stat(path).st_mtime
+            if self._expired(mtime):
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as f:
+                value = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            os.utime(path, (time.time(), mtime))  # mark as most recently used, keep its age
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: str):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(e[1] for e in entries)
+            for _, size, path, _, mtime in sorted(entries):
+                if total <= self.max_bytes and not self._expired(mtime):
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.evictions += 1
+
+    def clear(self, prefix: str = "") -> int:
+        """Delete entries whose key starts with prefix (all by default); return the count."""
+        removed = 0
+        with self._lock:
+            for _, _, path, key, _ in self._entries():
+                if key.startswith(prefix):
+                    try:
+                        os.remove(path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(entries),
+            "bytes": sum(e[1] for e in entries),
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class BlobStore:
+    """
+    Content-addressed, compressed text blobs ("<prefix>-<sha256>.zst" or ".z").
+    Identical text is stored once. Reads refresh a blob's mtime (at most hourly),
+    so blobs still used by live sessions survive; a background thread deletes
+    blobs idle for longer than ttl_seconds, together with their sidecar files.
+    """
+
+    TOUCH_INTERVAL = 3600
+    CODECS = {".zst": "zstd", ".z": "zlib"}
+    # Uncompressed uuid-named OCR text written to the shared temp dir before this store
+    # existed; only the "syllabus-" prefix, so other programs' files are never matched.
+    LEGACY_RE = re.compile(r"^syllabus-[0-9a-f]{32}\.txt(\.index\.json)?$")
+
+    def __init__(self, directory: str, ttl_seconds: int, codec: str = "zstd", gc_interval: int = 900,
+                 memory_bytes: int = 0):
+        self.directory = directory
+        self.memory_bytes = memory_bytes  # decoded blobs kept in process; they never change
+        self.ttl_seconds = ttl_seconds
+        self.codec = codec if codec == "zlib" or zstd is not None else "zlib"
+        self.gc_interval = gc_interval
+        self.writes = 0
+        self.dedup_hits = 0
+        self.bytes_in = 0       # uncompressed bytes handed to put()
+        self.bytes_written = 0  # compressed bytes actually written
+        self.gc_runs = 0
+        self.reclaimed_files = 0
+        self.reclaimed_bytes = 0
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # path -> text
+        self._memory_used = 0
+        self._gc_pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _ext(self) -> str:
+        return ".zst" if self.codec == "zstd" else ".z"
+
+    def _find(self, name: str):
+        for ext in self.CODECS:
+            path = os.path.join(self.directory, name + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _touch(self, path: str):
+        try:
+            if time.time() - os.stat(path).st_mtime > self.TOUCH_INTERVAL:
+                os.utime(path)
+        except OSError:
+            pass
+
+    def put(self, prefix: str, text: str) -> str:
+        """Store text (once per content) and return its path."""
+        self.start_gc()
+        raw = text.encode("utf-8")
+        name = f"{prefix}-{hashlib.sha256(raw).hexdigest()}"
+        path = self._find(name)
+        if path:
+            try:
+                os.utime(path)  # a new reference: restart its idle clock
+                with self._lock:
+                    self.dedup_hits += 1
+                return path
+            except FileNotFoundError:
+                pass  # collected in the meantime; write it again
+        if self.codec == "zstd":
+            data = zstd.ZstdCompressor(level=6).compress(raw)
+        else:
+            data = zlib.compress(raw, 6)
+        path = os.path.join(self.directory, name + self._ext())
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.writes += 1
+            self.bytes_in += len(raw)
+            self.bytes_written += len(data)
+        return path
+
+    def get(self, path: str) -> str:
+        with self._lock:
+            text = self._memory.get(path)
+            if text is not None:
+                self._memory.move_to_end(path)
+        if text is not None and os.path.exists(path):
+            self._touch(path)
+            return text
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return ""
+        ext = os.path.splitext(path)[1]
+        if ext == ".zst":
+            data = zstd.ZstdDecompressor().decompress(data)
+        elif ext == ".z":
+            data = zlib.decompress(data)
+        self._touch(path)
+        text = data.decode("utf-8")
+        self._remember(path, text)
+        return text
+
+    def exists(self, path: str) -> bool:
+        """Whether a blob is still stored. Counts as a use, so sessions that never read it keep it alive."""
+        if not path or not os.path.exists(path):
+            return False
+        self._touch(path)
+        return True
+
+    def _remember(self, path: str, text: str):
+        size = len(text)
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            if path in self._memory:
+                return
+            self._memory[path] = text
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, old = self._memory.popitem(last=False)
+                self._memory_used -= len(old)
+
+    def _expired_files(self, directory: str, match):
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            it = os.scandir(directory)
+        except FileNotFoundError:
+            return
+        with it:
+            for e in it:
+                if not match(e.name):
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                if st.st_mtime < cutoff:
+                    yield e.path, st.st_size
+
+    def gc(self) -> dict:
+        """Delete idle blobs, orphaned sidecars, temp files of interrupted writes and expired legacy files."""
+        removed = reclaimed = 0
+        blob_ext = tuple(self.CODECS)
+        candidates = list(self._expired_files(self.directory, lambda n: n.endswith(blob_ext + (".tmp",))))
+        candidates += self._expired_files(tempfile.gettempdir(), self.LEGACY_RE.match)
+        cutoff = time.time() - self.ttl_seconds
+        for path, size in candidates:
+            try:
+                if os.stat(path).st_mtime >= cutoff:  # touched since the scan
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            reclaimed += size
+        # Sidecars (e.g. the /ask chunk index) whose blob is gone
+        with os.scandir(self.directory) as it:
+            names = {e.name for e in it}
+        for name in names:
+            if name.endswith(".tmp"):  # possibly a write in progress; removed above once older than the TTL
+                continue
+            base = name.split(".", 1)[0]
+            if any(name == base + ext for ext in blob_ext) or any(base + ext in names for ext in blob_ext):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                size = os.stat(path).st_size
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            reclaimed += size
+        with self._lock:
+            self.gc_runs += 1
+            self.reclaimed_files += removed
+            self.reclaimed_bytes += reclaimed
+        return {"removed": removed, "reclaimed_bytes": reclaimed}
+
+    def _gc_loop(self):
+        while True:
+            time.sleep(self.gc_interval)
+            try:
+                self.gc()
+            except Exception as e:
+                app.logger.warning("Blob GC failed: %s", e)
+
+    def start_gc(self):
+        """Start the background collector once per process (again after a fork)."""
+        if self.gc_interval <= 0 or self._gc_pid == os.getpid():
+            return
+        with self._lock:
+            if self._gc_pid == os.getpid():
+                return
+            self._gc_pid = os.getpid()
+        threading.Thread(target=self._gc_loop, name="blob-gc", daemon=True).start()
+
+    def stats(self) -> dict:
+        files = stored = 0
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.name.endswith(tuple(self.CODECS)):
+                    try:
+                        stored += e.stat().st_size
+                        files += 1
+                    except FileNotFoundError:
+                        pass
+        return {
+            "blobs": files,
+            "bytes_stored": stored,
+            "codec": self.codec,
+            "ttl_seconds": self.ttl_seconds,
+            "writes": self.writes,
+            "dedup_hits": self.dedup_hits,
+            "compression_ratio": round(self.bytes_in / self.bytes_written, 2) if self.bytes_written else 0.0,
+            "memory_entries": len(self._memory),
+            "gc_runs": self.gc_runs,
+            "reclaimed_files": self.reclaimed_files,
+            "reclaimed_bytes": self.reclaimed_bytes,
+        }
+
+
+OCR_CACHE = DiskLRUCache(
+    os.path.join(CACHE_DIR, "ocr"),
+    int(float(os.getenv("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024),
+)
+EXTRACT_CACHE = DiskLRUCache(
+    os.path.join(CACHE_DIR, "extract"),
+    int(float(os.getenv("EXTRACT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    ttl_seconds=int(float(os.getenv("EXTRACT_CACHE_TTL_DAYS", "30")) * 86400),
+)
+BLOB_STORE = BlobStore(
+    os.path.join(CACHE_DIR, "blobs"),
+    ttl_seconds=int(os.getenv("BLOB_TTL_SECONDS", str(SESSION_TTL_SECONDS))),
+    codec=os.getenv("BLOB_COMPRESSION", "zstd").lower(),
+    gc_interval=int(os.getenv("BLOB_GC_INTERVAL_SECONDS", "900")),
+    memory_bytes=int(float(os.getenv("BLOB_MEMORY_CACHE_MB", "32")) * 1024 * 1024),
+)
+
 # ===== Helpers =====
 
+# Process-wide API clients: Gemini is configured once, and the GenerativeModel
+# and Vision clients (each Vision client owns a gRPC channel) are reused by
+# every request. The registry is reset in forked children, so pre-forking
+# servers never share a channel across processes.
+VISION_CHANNELS = max(1, int(os.getenv("VISION_CHANNELS", "2")))
+
+_clients = {}
+_clients_lock = threading.Lock()
+_vision_rr = [0]
+
+def _reset_clients():
+    global _clients_lock
+    _clients.clear()
+    _clients_lock = threading.Lock()  # a lock held by another thread at fork time stays held in the child
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients)
+
 def ensure_genai():
     """Configure Gemini once per process."""
     global genai
@@ -406,16 +1238,425 @@ def ensure_genai():
         return None
     if genai is None:
         raise RuntimeError("google.generativeai not available. Install google-generativeai.")
+    if _clients.get("genai_configured"):
+        return genai
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         raise RuntimeError("GEMINI_API_KEY is not set.")
-    genai.configure(api_key=api_key)
+    with _clients_lock:
+        if not _clients.get("genai_configured"):
+            genai.configure(api_key=api_key)
+            _clients["genai_configured"] = True
     return genai
 
-def ocr_pdf_with_vision(pdf_bytes: bytes) -> str:
+def get_gemini_model(name: str = None):
+    """Shared GenerativeModel for `name` (GEMINI_MODEL by default)."""
+    name = name or GEMINI_MODEL
+    key = f"gemini:{name}"
+    model = _clients.get(key)
+    if model is None:
+        ensure_genai()
+        with _clients_lock:
+            model = _clients.get(key)
+            if model is None:
+                model = _clients[key] = genai.GenerativeModel(name)
+    return model
+
+def get_vision_client():
+    """
+    One of VISION_CHANNELS shared ImageAnnotatorClients, round-robin, so
+    concurrent OCR spreads over a few gRPC connections instead of opening one per upload.
+    """
+    if vision is None:
+        raise RuntimeError("google-cloud-vision not available. Install google-cloud-vision or use USE_MOCK=1.")
+    pool = _clients.get("vision")
+    if pool is None:
+        with _clients_lock:
+            pool = _clients.get("vision")
+            if pool is None:
+                pool = _clients["vision"] = [_build_vision_client() for _ in range(VISION_CHANNELS)]
+    _vision_rr[0] += 1
+    return pool[_vision_rr[0] % len(pool)]
+
+def warmup():
+    """
+    Create API clients ahead of the first request. Call it from a gunicorn
+    post_fork hook (or set WARMUP_ON_START=1) so no user pays the setup cost.
+    Failures are logged, not raised: the request path reports them properly.
+    """
+    if USE_MOCK:
+        return
+    for name, create in (("Gemini", get_gemini_model), ("Vision", get_vision_client)):
+        try:
+            create()
+        except Exception as e:
+            app.logger.warning("Warmup of %s client failed: %s", name, e)
+
+OCR_RENDER_DPI = int(os.getenv("OCR_RENDER_DPI", "200"))
+PAGE_BREAK = "\n\f"  # separates pages in OCR output; a form feed is invisible in the OCR pane
+# How rendered pages are encoded for Vision. Adaptive DPI only lowers the
+# resolution when the smallest text on a page still gets OCR_TARGET_GLYPH_PX.
+OCR_ENCODING = {
+    "format": os.getenv("OCR_IMAGE_FORMAT", "png").lower(),  # png | jpeg | webp
+    "quality": int(os.getenv("OCR_IMAGE_QUALITY", "85")),  # jpeg/webp only
+    "grayscale": os.getenv("OCR_GRAYSCALE", "0") == "1",
+    "dpi": OCR_RENDER_DPI,
+    "adaptive_dpi": os.getenv("OCR_ADAPTIVE_DPI", "0") == "1",
+    "min_dpi": int(os.getenv("OCR_MIN_DPI", "120")),
+}
+OCR_TARGET_GLYPH_PX = 24
+OCR_ADAPTIVE_MIN_COVERAGE = 0.2  # share of page height the text lines must span to measure font size
+# Rasterize on a shared process pool instead of the request thread (PyMuPDF only)
+OCR_RENDER_PROCESSES = int(os.getenv("OCR_RENDER_PROCESSES", "0"))  # 0/1 = off
+OCR_RENDER_CHUNK = max(1, int(os.getenv("OCR_RENDER_CHUNK", "4")))  # pages per worker task
+OCR_MAX_IN_FLIGHT = max(1, int(os.getenv("OCR_MAX_IN_FLIGHT", "4")))  # 1 = serial
+OCR_BATCH_SIZE = min(16, max(1, int(os.getenv("OCR_BATCH_SIZE", "1"))))  # Vision caps sync batches at 16
+OCR_PREFETCH = max(1, int(os.getenv("OCR_PREFETCH", "4")))  # rendered pages buffered ahead of OCR
+OCR_BATCH_MAX_BYTES = int(float(os.getenv("OCR_BATCH_MAX_MB", "8")) * 1024 * 1024)
+VISION_API_ENDPOINT = os.getenv("VISION_API_ENDPOINT", "")
+# Born-digital pages: read PyMuPDF's text layer instead of rendering + OCR
+OCR_TEXT_LAYER = os.getenv("OCR_TEXT_LAYER", "1") == "1"
+OCR_TEXT_MIN_CHARS = int(os.getenv("OCR_TEXT_MIN_CHARS", "80"))
+OCR_TEXT_MIN_GLYPH_RATIO = float(os.getenv("OCR_TEXT_MIN_GLYPH_RATIO", "0.9"))
+
+def _ocr_backend() -> str:
+    if fitz is not None:
+        return "pymupdf+text" if OCR_TEXT_LAYER else "pymupdf"
+    if convert_from_bytes is not None:
+        return "pdf2image"
+    return "none"
+
+def _open_pdf(pdf):
+    """PyMuPDF document from a file path (read lazily from disk) or in-memory bytes."""
+    if isinstance(pdf, str):
+        return fitz.open(pdf)
+    return fitz.open(stream=pdf, filetype="pdf")
+
+def _pdf_sha256(pdf) -> str:
+    if not isinstance(pdf, str):
+        return hashlib.sha256(pdf).hexdigest()
+    h = hashlib.sha256()
+    with open(pdf, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+# Bumped when the layout of cached OCR text changes (v2: blank pages keep their slot).
+OCR_TEXT_VERSION = 2
+
+def _ocr_cache_key(pdf, backend: str, sha256: str = None) -> str:
+    """SHA-256 of the PDF first, so `flask ocr-cache clear --sha256` can match by prefix."""
+    digest = sha256 or _pdf_sha256(pdf)
+    return f"{digest}-{backend}-{_encoding_tag(OCR_ENCODING)}-v{OCR_TEXT_VERSION}"
+
+def _encoding_tag(encoding: dict) -> str:
+    """Short label for an encoding policy, e.g. "200png" or "150jpeg70-gray-adaptive"."""
+    tag = f"{encoding['dpi']}{encoding['format']}"
+    if encoding["format"] != "png":
+        tag += str(encoding["quality"])
+    if encoding["grayscale"]:
+        tag += "-gray"
+    if encoding["adaptive_dpi"]:
+        tag += f"-adaptive{encoding['min_dpi']}"
+    return tag
+
+def _page_dpi(page, encoding: dict) -> int:
+    """
+    Render DPI for a PyMuPDF page: lower for pages whose smallest text is large (slides, posters).
+    Only trusted when the text layer actually covers the page. Rendered pages are usually
+    scans, and a small digital header or stamp says nothing about the scanned body's font size.
+    """
+    dpi = encoding["dpi"]
+    if not encoding["adaptive_dpi"]:
+        return dpi
+    sizes, glyphs, rows = [], 0, []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", ()):
+            spans = [span for span in line["spans"] if span["text"].strip()]
+            if not spans:
+                continue
+            sizes.extend(span["size"] for span in spans)
+            glyphs += sum(len(span["text"].strip()) for span in spans)
+            rows.append((line["bbox"][1], line["bbox"][3]))
+    if glyphs < OCR_TEXT_MIN_CHARS or _vertical_coverage(rows, page.rect.height) < OCR_ADAPTIVE_MIN_COVERAGE:
+        return dpi  # scan, or a scan with a few digital lines: keep full resolution
+    needed = int(OCR_TARGET_GLYPH_PX * 72 / min(sizes))
+    return max(encoding["min_dpi"], min(dpi, needed))
+
+def _vertical_coverage(rows: list, height: float) -> float:
+    """Fraction of the page height covered by the union of (top, bottom) line extents."""
+    covered, reach = 0.0, float("-inf")
+    for top, bottom in sorted(rows):
+        top = max(top, reach)
+        if bottom > top:
+            covered += bottom - top
+            reach = bottom
+    return covered / height if height else 0.0
+
+def _render_page(page, encoding: dict) -> bytes:
+    """Rasterize a PyMuPDF page and encode it per the policy."""
+    colorspace = fitz.csGRAY if encoding["grayscale"] else fitz.csRGB
+    pix = page.get_pixmap(dpi=_page_dpi(page, encoding), colorspace=colorspace)
+    if encoding["format"] == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=encoding["quality"])
+    if encoding["format"] == "webp":
+        return pix.pil_tobytes(format="WEBP", quality=encoding["quality"])
+    return pix.tobytes("png")
+
+def _encode_pil(img, encoding: dict) -> bytes:
+    """Encode a pdf2image PIL page per the policy (no adaptive DPI: there is no text layer to measure)."""
+    if encoding["grayscale"]:
+        img = img.convert("L")
+    fmt = {"jpeg": "JPEG", "webp": "WEBP"}.get(encoding["format"], "PNG")
+    with io.BytesIO() as buf:
+        if fmt == "PNG":
+            img.save(buf, format=fmt)
+        else:
+            img.save(buf, format=fmt, quality=encoding["quality"])
+        return buf.getvalue()
+
+def _usable_text_layer(page) -> str:
+    """
+    Return the page's embedded text if it looks trustworthy, else "".
+    Scans have little or no text layer; broken font encodings show up as
+    U+FFFD or control characters, so both are checked before skipping OCR.
+    """
+    text = page.get_text("text").strip()
+    glyphs = [c for c in text if not c.isspace()]
+    if len(glyphs) < OCR_TEXT_MIN_CHARS:
+        return ""
+    mapped = sum(1 for c in glyphs if c != "\ufffd" and c.isprintable())
+    if mapped / len(glyphs) < OCR_TEXT_MIN_GLYPH_RATIO:
+        return ""
+    return text
+
+def _page_item(idx: int, page, encoding: dict, text_layer: bool):
+    embedded = _usable_text_layer(page) if text_layer else ""
+    if embedded:
+        return idx, embedded, None
+    return idx, None, _render_page(page, encoding)
+
+def _iter_pages(pdf, encoding: dict = OCR_ENCODING, text_layer: bool = OCR_TEXT_LAYER):
+    """
+    Lazily yield (idx, text, img_bytes) per page, 1-based, for a PDF path or bytes.
+    Pages with a usable text layer carry text and img_bytes=None; the rest are
+    rendered per `encoding`.
+    """
+    if fitz is not None and OCR_RENDER_PROCESSES > 1:
+        yield from _iter_pages_multiprocess(pdf, encoding, text_layer)
+    elif fitz is not None:
+        doc = _open_pdf(pdf)
+        try:
+            for idx, page in enumerate(doc, start=1):
+                yield _page_item(idx, page, encoding, text_layer)
+        finally:
+            doc.close()
+    elif convert_from_bytes is not None:
+        # One page per call so pdf2image never holds the whole document as PIL images.
+        if isinstance(pdf, str):
+            page_count = pdfinfo_from_path(pdf)["Pages"]
+            convert = lambda **kw: convert_from_path(pdf, **kw)
+        else:
+            page_count = pdfinfo_from_bytes(pdf)["Pages"]
+            convert = lambda **kw: convert_from_bytes(pdf, **kw)
+        for idx in range(1, page_count + 1):
+            (img,) = convert(dpi=encoding["dpi"], first_page=idx, last_page=idx)
+            img_bytes = _encode_pil(img, encoding)
+            del img
+            yield idx, None, img_bytes
+    else:
+        raise RuntimeError("No PDF renderer found (PyMuPDF or pdf2image). Install one or set USE_MOCK=1.")
+
+_render_pool = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    """
+    Process-wide rasterizer pool, created on first use and reused across uploads.
+    Recreated if this process was forked after creating it (pre-forking servers).
+    """
+    global _render_pool, _render_pool_pid
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            # Never fork a threaded web worker; forkserver/spawn children import this module fresh.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _render_pool = ProcessPoolExecutor(
+                max_workers=OCR_RENDER_PROCESSES, mp_context=multiprocessing.get_context(method)
+            )
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+@atexit.register
+def _shutdown_render_pool():
+    """Registered once; shuts down whichever pool this process created last."""
+    with _render_pool_lock:
+        pool = _render_pool if _render_pool_pid == os.getpid() else None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+def _render_page_range(pdf_path: str, start: int, stop: int, encoding: dict, text_layer: bool) -> list:
+    """Process-pool task: open the PDF independently and return page items for [start, stop), 0-based."""
+    doc = fitz.open(pdf_path)
+    try:
+        return [_page_item(i + 1, doc[i], encoding, text_layer) for i in range(start, stop)]
+    finally:
+        doc.close()
+
+def _iter_pages_multiprocess(pdf, encoding: dict, text_layer: bool):
+    """
+    Same items as _iter_pages, rendered by the shared process pool in
+    OCR_RENDER_CHUNK-page ranges. At most one range per worker is in flight,
+    and results are yielded in page order. Workers open the PDF by path, so
+    in-memory bytes are written to a temp file first.
+    """
+    global _render_pool
+    if isinstance(pdf, str):
+        pdf_path, owned = pdf, False
+    else:
+        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+            f.write(pdf)
+            pdf_path, owned = f.name, True
+    pending = deque()
+    try:
+        doc = fitz.open(pdf_path)
+        page_count = len(doc)
+        doc.close()
+        ranges = deque(
+            (start, min(start + OCR_RENDER_CHUNK, page_count))
+            for start in range(0, page_count, OCR_RENDER_CHUNK)
+        )
+        pool = _get_render_pool()
+        while ranges or pending:
+            while ranges and len(pending) < OCR_RENDER_PROCESSES:
+                start, stop = ranges.popleft()
+                pending.append(pool.submit(_render_page_range, pdf_path, start, stop, encoding, text_layer))
+            try:
+                items = pending.popleft().result()
+            except BrokenProcessPool:
+                with _render_pool_lock:
+                    if _render_pool is pool:
+                        _render_pool = None  # a worker died; start fresh on the next upload
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            yield from items
+    finally:
+        for fut in pending:
+            fut.cancel()
+        if owned:
+            try:
+                os.remove(pdf_path)
+            except OSError:
+                pass
+
+def _prefetch(items, depth: int):
+    """
+    Drive the `items` generator on a background thread, keeping at most
+    `depth` results queued. Producer exceptions are re-raised in the consumer;
+    closing the returned generator stops (and closes) the producer.
+    """
+    buf = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    DONE = object()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buf.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((None, item)):
+                    return
+            put((None, DONE))
+        except BaseException as e:
+            put((e, None))
+        finally:
+            items.close()
+
+    threading.Thread(target=produce, name="pdf-render", daemon=True).start()
+    try:
+        while True:
+            err, item = buf.get()
+            if err is not None:
+                raise err
+            if item is DONE:
+                return
+            yield item
+    finally:
+        stop.set()
+
+def _build_vision_client():
+    """
+    Build an ImageAnnotatorClient. VISION_API_ENDPOINT overrides the host;
+    an http:// endpoint (e.g. a local fake) is spoken to over REST without credentials.
+    """
+    if not VISION_API_ENDPOINT:
+        return vision.ImageAnnotatorClient()
+    options = {"api_endpoint": VISION_API_ENDPOINT}
+    if VISION_API_ENDPOINT.startswith("http://"):
+        from google.auth.credentials import AnonymousCredentials
+        return vision.ImageAnnotatorClient(
+            credentials=AnonymousCredentials(), transport="rest", client_options=options
+        )
+    return vision.ImageAnnotatorClient(client_options=options)
+
+def _ocr_image(client, idx: int, img_bytes: bytes) -> str:
+    """OCR one rendered page; idx is 1-based and only used in the error message."""
+    resp = client.text_detection(image=vision.Image(content=img_bytes))
+    if resp.error.message:
+        raise RuntimeError(f"Vision OCR error on page {idx}: {resp.error.message}")
+    if resp.text_annotations:
+        return resp.text_annotations[0].description
+    return ""
+
+def _batch_pages(pages, size: int, max_bytes: int):
+    """
+    Group (idx, img_bytes) pairs into runs of at most `size` pages whose
+    base64-encoded payload stays under max_bytes. A single oversized page
+    still gets a batch of its own.
+    """
+    batch, nbytes = [], 0
+    for idx, img_bytes in pages:
+        encoded = 4 * ((len(img_bytes) + 2) // 3)
+        if batch and (len(batch) >= size or nbytes + encoded > max_bytes):
+            yield batch
+            batch, nbytes = [], 0
+        batch.append((idx, img_bytes))
+        nbytes += encoded
+    if batch:
+        yield batch
+
+def _ocr_batch(client, batch) -> list:
+    """OCR a batch of (idx, img_bytes) pages with one batch_annotate_images call; texts come back in order."""
+    if len(batch) == 1:
+        return [_ocr_image(client, *batch[0])]
+    feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+    requests = [
+        vision.AnnotateImageRequest(image=vision.Image(content=img_bytes), features=[feature])
+        for _, img_bytes in batch
+    ]
+    resp = client.batch_annotate_images(requests=requests)
+    texts = []
+    for (idx, _), page_resp in zip(batch, resp.responses):
+        if page_resp.error.message:
+            raise RuntimeError(f"Vision OCR error on page {idx}: {page_resp.error.message}")
+        texts.append(page_resp.text_annotations[0].description if page_resp.text_annotations else "")
+    return texts
+
+def ocr_pdf_with_vision(pdf, stats: dict = None, sha256: str = None) -> str:
     """
-    Convert PDF to page images, then OCR with Google Cloud Vision.
+    Convert PDF (a file path or bytes) to page images, then OCR with Google Cloud Vision.
+    Pages with a usable embedded text layer are read directly and never rendered.
     Returns concatenated text.
+    Results are cached by PDF hash (pass `sha256` if already known), backend and
+    encoding policy; a hit skips rendering and OCR.
+    If `stats` is given it is filled with page counts per path (or cached=True).
     If USE_MOCK, returns a realistic sample.
     """
     if USE_MOCK:
@@ -441,64 +1682,253 @@ def ocr_pdf_with_vision(pdf_bytes: bytes) -> str:
             "Week 13: Presentations, Final Project (20%).\n"
         )
 
-    if vision is None:
-        raise RuntimeError("google-cloud-vision not available. Install google-cloud-vision or use USE_MOCK=1.")
-
-    # Convert PDF → images
-    images = []
-    if fitz is not None:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        try:
-            for page in doc:
-                pix = page.get_pixmap(dpi=200)
-                images.append(pix.tobytes("png"))
-        finally:
-            doc.close()
-    elif convert_from_bytes is not None:
-        pil_pages = convert_from_bytes(pdf_bytes, dpi=200)
-        for img in pil_pages:
-            with io.BytesIO() as buf:
-                img.save(buf, format="PNG")
-                images.append(buf.getvalue())
-    else:
-        raise RuntimeError("No PDF renderer found (PyMuPDF or pdf2image). Install one or set USE_MOCK=1.")
-
-    client = vision.ImageAnnotatorClient()
-    texts = []
-    for idx, img_bytes in enumerate(images, start=1):
-        image = vision.Image(content=img_bytes)
-        resp = client.text_detection(image=image)
-        if resp.error.message:
-            raise RuntimeError(f"Vision OCR error on page {idx}: {resp.error.message}")
-        if resp.text_annotations:
-            texts.append(resp.text_annotations[0].description)
-    return "\n".join(texts).strip()
+    backend = _ocr_backend()
+    cache_key = _ocr_cache_key(pdf, backend, sha256)
+    cached = OCR_CACHE.get(cache_key)
+    if stats is None:
+        stats = {}
+    if cached is not None:
+        stats["cached"] = True
+        return cached
+
+    # Stream PDF → page text (text layer) or images (needs OCR). Pages are
+    # rendered on a background thread at most OCR_PREFETCH ahead of OCR and
+    # dropped once their batch is recognized, so memory doesn't grow with page count.
+    page_texts = {}  # 1-based page index -> text
+    stats.update(cached=False, pages=0, text_layer_pages=0, ocr_pages=0, pages_ocrd=0)
+    pages = _prefetch(_iter_pages(pdf), OCR_PREFETCH)
+
+    def image_pages():
+        for idx, embedded, img_bytes in pages:
+            stats["pages"] += 1
+            if img_bytes is None:
+                stats["text_layer_pages"] += 1
+                page_texts[idx] = embedded
+                continue
+            if vision is None:
+                raise RuntimeError("google-cloud-vision not available. Install google-cloud-vision or use USE_MOCK=1.")
+            stats["ocr_pages"] += 1
+            yield idx, img_bytes
+
+    def collect(batch, texts):
+        for (idx, _), t in zip(batch, texts):
+            page_texts[idx] = t
+        stats["pages_ocrd"] += len(batch)
+
+    client = None
+    pool = None
+    pending = deque()  # (batch, future), oldest first
+    try:
+        for batch in _batch_pages(image_pages(), OCR_BATCH_SIZE, OCR_BATCH_MAX_BYTES):
+            if client is None:
+                client = get_vision_client()
+            if OCR_MAX_IN_FLIGHT == 1:
+                collect(batch, _ocr_batch(client, batch))
+                continue
+            if pool is None:
+                pool = ThreadPoolExecutor(max_workers=OCR_MAX_IN_FLIGHT, thread_name_prefix="vision-ocr")
+            while len(pending) >= OCR_MAX_IN_FLIGHT:
+                done_batch, fut = pending.popleft()
+                collect(done_batch, fut.result())
+            pending.append((batch, pool.submit(_ocr_batch, client, batch)))
+        # Drained oldest first, so the lowest failing page is the error that surfaces.
+        while pending:
+            done_batch, fut = pending.popleft()
+            collect(done_batch, fut.result())
+    finally:
+        pages.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    # Blank pages stay in as empty strings so page N of the text is page N of the PDF.
+    text = PAGE_BREAK.join(page_texts.get(i, "").strip() for i in range(1, stats["pages"] + 1))
+    OCR_CACHE.put(cache_key, text)
+    return text
 
 # --- CHANGED: helpers to persist/retrieve large blobs outside the cookie session
 def _save_large_blob(prefix: str, content: str) -> str:
-    """Persist large text to a temp file; return its path."""
-    path = os.path.join(tempfile.gettempdir(), f"{prefix}-{uuid.uuid4().hex}.txt")
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(content)
-    return path
+    """Persist large text in the blob store; return its path."""
+    return BLOB_STORE.put(prefix, content)
 
 def _read_blob(path: str) -> str:
     if not path:
         return ""
+    return BLOB_STORE.get(path)
+
+# --- /ocr-text serves OCR text a few pages at a time
+OCR_TEXT_PAGES_PER_REQUEST = int(os.getenv("OCR_TEXT_PAGES_PER_REQUEST", "5"))
+
+def read_ocr_pages(text_path: str, first: int, count: int):
+    """Pages first..first+count-1 (1-based) of a stored OCR text, plus the total page count."""
+    text = _read_blob(text_path)  # served from the blob store's decoded-text LRU when warm
+    if not text:
+        return [], 0
+    all_pages = text.split(PAGE_BREAK)
+    pages = [
+        {"page": n, "text": all_pages[n - 1]}
+        for n in range(first, min(first + count, len(all_pages) + 1))
+    ]
+    return pages, len(all_pages)
+
+GEMINI_MODEL = "gemini-flash-latest"
+
+EXTRACTION_INSTRUCTIONS = (
+    "You are extracting structured policy and schedule data from a course syllabus OCR text.\n"
+    "Return STRICT JSON with keys: faq, schedule, summary.\n"
+    "faq must include: late_work_policy, attendance_policy, course_structure (all strings).\n"
+    "schedule is an array of objects with keys: week (int), assignments (int), weight_pct (float), notes (string).\n"
+    "Interpret weights by week as the total percentage of final grade assessed that week (sum may be ~100%). "
+    "If a week mentions multiple graded items, sum their percentages in that week and set assignments count accordingly. "
+    "If an item is ungraded, weight_pct=0 but still increment assignments if it's an assignment.\n"
+    "summary: one-sentence overview.\n"
+    "Only output JSON. No markdown."
+)
+CHUNK_INSTRUCTIONS = (
+    "The OCR text below is part {part} of {total} of one syllabus. Extract only what this part states: "
+    "use an empty string for any faq field this part does not cover, include only weeks that appear in this part, "
+    "and write summary from what this part shows."
+)
+# Any edit to the prompts changes this, so stale cached extractions are never served.
+EXTRACTION_PROMPT_VERSION = hashlib.sha256(
+    (EXTRACTION_INSTRUCTIONS + CHUNK_INSTRUCTIONS).encode("utf-8")
+).hexdigest()[:12]
+
+# Map-reduce extraction for long syllabi; 0 disables chunking.
+EXTRACT_CHUNK_CHARS = int(os.getenv("EXTRACT_CHUNK_CHARS", "12000"))
+EXTRACT_MAX_IN_FLIGHT = max(1, int(os.getenv("EXTRACT_MAX_IN_FLIGHT", "4")))
+
+WEEK_HEADING_RE = re.compile(r"(?im)^(?=[ \t]*(?:week|wk)\.?[ \t]*\d+)")
+
+def _extract_cache_key(ocr_text: str, mode: str = "single") -> str:
+    normalized = " ".join(ocr_text.split())
+    h = hashlib.sha256()
+    for part in (GEMINI_MODEL, EXTRACTION_PROMPT_VERSION, mode, normalized):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _split_for_extraction(ocr_text: str, max_chars: int) -> list:
+    """
+    Split OCR text into chunks of at most ~max_chars, cutting on page breaks,
+    then week headings, then blank lines, and packing consecutive pieces greedily.
+    """
+    if max_chars <= 0 or len(ocr_text) <= max_chars:
+        return [ocr_text]
+
+    def pieces(text, splitters):
+        if len(text) <= max_chars or not splitters:
+            return [text]
+        out = []
+        for part in splitters[0](text):
+            out.extend(pieces(part, splitters[1:]))
+        return out
+
+    splitters = [
+        lambda t: t.split(PAGE_BREAK),
+        lambda t: WEEK_HEADING_RE.split(t),
+        lambda t: re.split(r"\n\s*\n", t),
+        lambda t: [t[i:i + max_chars] for i in range(0, len(t), max_chars)],
+    ]
+    chunks, current = [], ""
+    for piece in pieces(ocr_text, splitters):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _gemini_json(model, prompt: str) -> dict:
+    resp = model.generate_content(prompt)
+    text = (resp.text or "").strip()
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return f.read()
-    except FileNotFoundError:
-        return ""
+        return json.loads(text)
+    except Exception:
+        m = re.search(r"\{.*\}", text, re.DOTALL)
+        if not m:
+            raise RuntimeError("Gemini did not return valid JSON.")
+        return json.loads(m.group(0))
+
+def _normalize_extraction(data: dict):
+    faq = data.get("faq", {})
+    schedule = data.get("schedule", [])
+    summary = data.get("summary", "")
+    norm = []
+    for item in schedule:
+        try:
+            norm.append({
+                "week": int(item.get("week")),
+                "assignments": int(item.get("assignments", 0)),
+                "weight_pct": float(item.get("weight_pct", 0.0)),
+                "notes": str(item.get("notes", "")).strip()
+            })
+        except Exception:
+            continue
+    norm.sort(key=lambda x: x["week"])
+    return faq, norm, summary
+
+_MISSING_POLICY_RE = re.compile(r"not (?:found|specified|mentioned|stated|provided)|^(?:n/?a|none|unknown|—|-)?$", re.I)
 
-def extract_structured_with_gemini(ocr_text: str):
+def _merge_extractions(parts: list):
+    """
+    Reduce per-chunk (faq, schedule, summary) results deterministically:
+      - schedule: identical fragments of a week are deduplicated (chunk overlap),
+        the rest are summed per week (assignments, weight_pct) with notes joined
+      - faq: per field, the longest text that isn't a "not found" placeholder
+      - summary: the first non-empty chunk summary (chunks are in document order)
+    """
+    weeks = {}
+    for _, schedule, _ in parts:
+        for item in schedule:
+            fragment = (item["assignments"], item["weight_pct"], " ".join(item["notes"].lower().split()))
+            frags = weeks.setdefault(item["week"], {})
+            frags.setdefault(fragment, item)
+    schedule = []
+    for week in sorted(weeks):
+        items = list(weeks[week].values())
+        notes = []
+        for item in items:
+            if item["notes"] and item["notes"] not in notes:
+                notes.append(item["notes"])
+        schedule.append({
+            "week": week,
+            "assignments": sum(i["assignments"] for i in items),
+            "weight_pct": round(sum(i["weight_pct"] for i in items), 4),
+            "notes": "; ".join(notes),
+        })
+
+    faq = {}
+    for key in ("late_work_policy", "attendance_policy", "course_structure"):
+        best = ""
+        for chunk_faq, _, _ in parts:
+            value = str((chunk_faq or {}).get(key) or "").strip()
+            if _MISSING_POLICY_RE.search(value):
+                continue
+            if len(value) > len(best):
+                best = value
+        faq[key] = best
+
+    summary = next((str(s).strip() for _, _, s in parts if str(s or "").strip()), "")
+    return faq, schedule, summary
+
+def extract_structured_with_gemini(ocr_text: str, stats: dict = None):
     """
     Ask Gemini to parse:
       - FAQs: late_work_policy, attendance_policy, course_structure
       - Weekly schedule array of {week:int, assignments:int, weight_pct:float, notes:str}
       - A short summary
     Returns (faq_dict, schedule_list, summary_str)
+    Text longer than EXTRACT_CHUNK_CHARS is extracted chunk by chunk in parallel and merged.
+    Results are cached by normalized OCR text, model and prompt version; on a miss,
+    a near-duplicate of an earlier syllabus (see NearDuplicateIndex) reuses its result.
+    If `stats` is given, stats["source"] says which of cache/near_duplicate/gemini answered.
     """
+    if stats is None:
+        stats = {}
     if USE_MOCK:
         faq = {
             "late_work_policy": "10% per day late up to 3 days; no submissions after 72 hours.",
@@ -523,47 +1953,46 @@ def extract_structured_with_gemini(ocr_text: str):
         summary = "Course mixes weekly HWs, two quizzes, a midterm, and a final project; strict late policy; attendance required."
         return faq, schedule, summary
 
-    ensure_genai()
-    model = genai.GenerativeModel("gemini-flash-latest")
-
-    system_instructions = (
-        "You are extracting structured policy and schedule data from a course syllabus OCR text.\n"
-        "Return STRICT JSON with keys: faq, schedule, summary.\n"
-        "faq must include: late_work_policy, attendance_policy, course_structure (all strings).\n"
-        "schedule is an array of objects with keys: week (int), assignments (int), weight_pct (float), notes (string).\n"
-        "Interpret weights by week as the total percentage of final grade assessed that week (sum may be ~100%). "
-        "If a week mentions multiple graded items, sum their percentages in that week and set assignments count accordingly. "
-        "If an item is ungraded, weight_pct=0 but still increment assignments if it's an assignment.\n"
-        "summary: one-sentence overview.\n"
-        "Only output JSON. No markdown."
-    )
-
-    prompt = f"{system_instructions}\n\nOCR_TEXT_START\n{ocr_text}\nOCR_TEXT_END"
-    resp = model.generate_content(prompt)
-    text = (resp.text or "").strip()
-    try:
-        data = json.loads(text)
-    except Exception:
-        m = re.search(r"\{.*\}", text, re.DOTALL)
-        if not m:
-            raise RuntimeError("Gemini did not return valid JSON.")
-        data = json.loads(m.group(0))
-
-    faq = data.get("faq", {})
-    schedule = data.get("schedule", [])
-    summary = data.get("summary", "")
-    norm = []
-    for item in schedule:
-        try:
-            norm.append({
-                "week": int(item.get("week")),
-                "assignments": int(item.get("assignments", 0)),
-                "weight_pct": float(item.get("weight_pct", 0.0)),
-                "notes": str(item.get("notes", "")).strip()
-            })
-        except Exception:
-            continue
-    norm.sort(key=lambda x: x["week"])
+    chunks = _split_for_extraction(ocr_text, EXTRACT_CHUNK_CHARS)
+    mode = "single" if len(chunks) == 1 else f"map{EXTRACT_CHUNK_CHARS}"
+    cache_key = _extract_cache_key(ocr_text, mode)
+    cached = EXTRACT_CACHE.get(cache_key)
+    if cached is not None:
+        data = json.loads(cached)
+        stats["source"] = "cache"
+        return data["faq"], data["schedule"], data["summary"]
+
+    signature = minhash_signature(ocr_text) if NEAR_DUP_INDEX.enabled else None
+    if signature is not None:
+        grading = grading_fingerprint(ocr_text)
+        match = NEAR_DUP_INDEX.lookup(signature, grading)
+        if match is not None:
+            # Not written to EXTRACT_CACHE: that cache is keyed by this exact text.
+            data, similarity = match
+            stats.update(source="near_duplicate", similarity=round(similarity, 3))
+            return data["faq"], data["schedule"], data["summary"]
+
+    model = get_gemini_model()
+
+    if len(chunks) == 1:
+        prompt = f"{EXTRACTION_INSTRUCTIONS}\n\nOCR_TEXT_START\n{ocr_text}\nOCR_TEXT_END"
+        faq, norm, summary = _normalize_extraction(_gemini_json(model, prompt))
+    else:
+        def extract_chunk(args):
+            part, chunk = args
+            note = CHUNK_INSTRUCTIONS.format(part=part, total=len(chunks))
+            prompt = f"{EXTRACTION_INSTRUCTIONS}\n{note}\n\nOCR_TEXT_START\n{chunk}\nOCR_TEXT_END"
+            return _normalize_extraction(_gemini_json(model, prompt))
+
+        with ThreadPoolExecutor(max_workers=min(EXTRACT_MAX_IN_FLIGHT, len(chunks)), thread_name_prefix="gemini-map") as pool:
+            parts = list(pool.map(extract_chunk, enumerate(chunks, start=1)))
+        faq, norm, summary = _merge_extractions(parts)
+
+    result = {"faq": faq, "schedule": norm, "summary": summary}
+    EXTRACT_CACHE.put(cache_key, json.dumps(result))
+    if signature is not None:
+        NEAR_DUP_INDEX.add(signature, grading, cache_key, result)
+    stats["source"] = "gemini"
     return faq, norm, summary
 
 
@@ -587,22 +2016,783 @@ def compute_assignments_by_week(schedule):
     return weeks, counts
 
 
+# ===== Near-duplicate syllabi (extraction reuse) =====
+# Sections of one course often differ only in instructor, room or dates. MinHash
+# signatures over 5-word shingles, bucketed with LSH, find a previously extracted
+# syllabus whose estimated Jaccard similarity reaches NEAR_DUP_THRESHOLD so its
+# faq/schedule/summary can be reused instead of calling Gemini again. Week numbers
+# and grading weights must also match exactly: changing "Midterm 20%" to 30%
+# barely moves the similarity but would make the reused schedule wrong.
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))  # <= 0 disables
+NEAR_DUP_SHINGLE_WORDS = 5
+NEAR_DUP_PERMUTATIONS = 128
+NEAR_DUP_ROWS = 4  # per LSH band: 32 bands, so pairs above ~0.5 similarity almost always collide
+
+_MINHASH_PRIME = (1 << 61) - 1
+_minhash_rng = random.Random(1729)  # fixed: signatures must match across processes and restarts
+_MINHASH_PARAMS = [
+    (_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(0, _MINHASH_PRIME))
+    for _ in range(NEAR_DUP_PERMUTATIONS)
+]
+
+def minhash_signature(text: str) -> list:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    n = NEAR_DUP_SHINGLE_WORDS
+    shingles = {" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+    return [min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in _MINHASH_PARAMS]
+
+_GRADING_NUMBER_RE = re.compile(
+    r"(?i)\b(?:week|wk)\.?\s*(\d+)|(\d+(?:\.\d+)?)\s*(?:%|percent\b|pts?\b|points?\b)"
+)
+
+def grading_fingerprint(text: str) -> str:
+    """Hash of the week numbers and weights/points in document order; moving or reweighting an item changes it."""
+    tokens = [
+        f"w{int(week)}" if week else f"{float(weight):g}"
+        for week, weight in _GRADING_NUMBER_RE.findall(text)
+    ]
+    return hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()
+
+def _lsh_buckets(signature: list) -> list:
+    r = NEAR_DUP_ROWS
+    return [
+        (band, hashlib.blake2b(repr(signature[i:i + r]).encode(), digest_size=8).hexdigest())
+        for band, i in enumerate(range(0, len(signature), r))
+    ]
+
+class NearDuplicateIndex:
+    """
+    SQLite-backed MinHash/LSH index of extracted syllabi, shared by every worker
+    on the host. Entries are tied to the extraction model and prompt version, so
+    changing either stops old results from being reused, and only match syllabi
+    with the same grading fingerprint.
+    """
+
+    def __init__(self, path: str, threshold: float):
+        self.path = path
+        self.threshold = threshold
+        self._local = threading.local()
+        if self.enabled:
+            self._db().executescript("""
+                CREATE TABLE IF NOT EXISTS docs (
+                    id INTEGER PRIMARY KEY, text_hash TEXT UNIQUE, extractor TEXT NOT NULL,
+                    signature TEXT NOT NULL, result TEXT NOT NULL, created REAL NOT NULL, grading TEXT);
+                CREATE TABLE IF NOT EXISTS buckets (band INTEGER NOT NULL, bucket TEXT NOT NULL, doc INTEGER NOT NULL);
+                CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);
+                CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """)
+            # Indexes from before grading fingerprints: their rows keep NULL and never match.
+            if "grading" not in {r[1] for r in self._db().execute("PRAGMA table_info(docs)")}:
+                self._db().execute("ALTER TABLE docs ADD COLUMN grading TEXT")
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    @staticmethod
+    def _extractor() -> str:
+        return f"{GEMINI_MODEL}:{EXTRACTION_PROMPT_VERSION}"
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def _count(self, db, name: str):
+        db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def lookup(self, signature: list, grading: str):
+        """
+        (result, similarity) of the most similar indexed syllabus with the same
+        grading fingerprint at or above the threshold, else None.
+        """
+        db = self._db()
+        candidates = set()
+        for band, bucket in _lsh_buckets(signature):
+            candidates.update(r[0] for r in db.execute(
+                "SELECT doc FROM buckets WHERE band = ? AND bucket = ?", (band, bucket)))
+        best, best_sim = None, 0.0
+        for doc in candidates:
+            row = db.execute(
+                "SELECT signature, result FROM docs WHERE id = ? AND extractor = ? AND grading = ?",
+                (doc, self._extractor(), grading),
+            ).fetchone()
+            if row is None:
+                continue
+            other = json.loads(row[0])
+            sim = sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+            if sim > best_sim:
+                best, best_sim = row[1], sim
+        found = best is not None and best_sim >= self.threshold
+        self._count(db, "lookups")
+        if found:
+            self._count(db, "reuses")
+        return (json.loads(best), best_sim) if found else None
+
+    def add(self, signature: list, grading: str, text_hash: str, result: dict):
+        db = self._db()
+        with db:
+            db.execute("BEGIN")
+            cur = db.execute(
+                "INSERT OR IGNORE INTO docs (text_hash, extractor, signature, result, created, grading)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (text_hash, self._extractor(), json.dumps(signature), json.dumps(result), time.time(), grading),
+            )
+            if cur.rowcount:
+                db.executemany(
+                    "INSERT INTO buckets (band, bucket, doc) VALUES (?, ?, ?)",
+                    [(band, bucket, cur.lastrowid) for band, bucket in _lsh_buckets(signature)],
+                )
+
+    def clear(self) -> int:
+        db = self._db()
+        with db:
+            db.execute("BEGIN")
+            removed = db.execute("DELETE FROM docs").rowcount
+            db.execute("DELETE FROM buckets")
+            db.execute("DELETE FROM counters")
+        return removed
+
+    def stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        db = self._db()
+        counters = dict(db.execute("SELECT name, value FROM counters").fetchall())
+        lookups, reuses = counters.get("lookups", 0), counters.get("reuses", 0)
+        return {
+            "enabled": True,
+            "threshold": self.threshold,
+            "documents": db.execute("SELECT COUNT(*) FROM docs").fetchone()[0],
+            "lookups": lookups,
+            "reuses": reuses,
+            "reuse_rate": round(reuses / lookups, 3) if lookups else 0.0,
+        }
+
+NEAR_DUP_INDEX = NearDuplicateIndex(os.path.join(CACHE_DIR, "near_dup.sqlite3"), NEAR_DUP_THRESHOLD)
+
+# ===== Syllabus retrieval (for /ask) =====
+# A small BM25 index over paragraph chunks is written next to the OCR blob at
+# upload time; /ask sends Gemini only the best chunks that fit the budget.
+ASK_CHUNK_CHARS = int(os.getenv("ASK_CHUNK_CHARS", "800"))
+ASK_TOP_K = int(os.getenv("ASK_TOP_K", "6"))
+ASK_TOKEN_BUDGET = int(os.getenv("ASK_TOKEN_BUDGET", "1500"))  # ~4 characters per token
+ASK_MIN_SCORE = float(os.getenv("ASK_MIN_SCORE", "1.0"))  # below this, send the full text
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it my of on or "
+    "the this to was what when where which who will with you your".split()
+)
+
+def _terms(text: str) -> list:
+    terms = []
+    for w in re.findall(r"[a-z0-9]+", text.lower()):
+        if len(w) > 4 and w.endswith("ies"):
+            w = w[:-3] + "y"
+        elif len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        if w in _STOPWORDS or (len(w) == 1 and not w.isdigit()):
+            continue
+        terms.append(w)
+    return terms
+
+def _paragraph_pieces(para: str, limit: int):
+    """A paragraph longer than `limit` split on line breaks, with lines still too long hard-cut."""
+    if len(para) <= limit:
+        yield para
+        return
+    for line in para.split("\n"):
+        line = line.strip()
+        for i in range(0, len(line), limit):
+            yield line[i:i + limit]
+
+def build_chunk_index(ocr_text: str) -> dict:
+    """Paragraph chunks of up to ASK_CHUNK_CHARS with per-chunk term counts and document frequencies."""
+    chunks, current = [], ""
+    for para in re.split(r"\n\s*\n|\f", ocr_text):
+        # OCR output separates lines with single newlines, so a whole page is often one "paragraph".
+        for piece in _paragraph_pieces(para.strip(), ASK_CHUNK_CHARS):
+            if not piece:
+                continue
+            if current and len(current) + len(piece) + 1 > ASK_CHUNK_CHARS:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+
+    tf, df = [], defaultdict(int)
+    for chunk in chunks:
+        counts = defaultdict(int)
+        for t in _terms(chunk):
+            counts[t] += 1
+        tf.append(dict(counts))
+        for t in counts:
+            df[t] += 1
+    lengths = [sum(c.values()) for c in tf]
+    return {
+        "chunk_chars": ASK_CHUNK_CHARS,
+        "chunks": chunks,
+        "tf": tf,
+        "df": dict(df),
+        "avgdl": (sum(lengths) / len(lengths)) if lengths else 0.0,
+    }
+
+def _index_path(text_path: str) -> str:
+    return f"{text_path}.index.json"
+
+def save_chunk_index(text_path: str, ocr_text: str):
+    with open(_index_path(text_path), "w", encoding="utf-8") as f:
+        json.dump(build_chunk_index(ocr_text), f)
+
+def _load_chunk_index(text_path: str, ocr_text: str) -> dict:
+    try:
+        with open(_index_path(text_path), "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("chunk_chars") == ASK_CHUNK_CHARS:
+            return index
+    except (FileNotFoundError, ValueError):
+        pass
+    # Sessions from before the index existed, or indexes built with other (or uncapped) chunk sizes
+    return build_chunk_index(ocr_text)
+
+def _bm25_scores(index: dict, query_terms: list, k1: float = 1.5, b: float = 0.75) -> list:
+    n = len(index["chunks"])
+    avgdl = index["avgdl"] or 1.0
+    scores = []
+    for counts in index["tf"]:
+        dl = sum(counts.values())
+        score = 0.0
+        for t in query_terms:
+            f = counts.get(t, 0)
+            if not f:
+                continue
+            df = index["df"].get(t, 0)
+            idf = math.log((n - df + 0.5) / (df + 0.5) + 1.0)
+            score += idf * f * (k1 + 1) / (f + k1 * (1 - b + b * dl / avgdl))
+        scores.append(score)
+    return scores
+
+def select_context(text_path: str, ocr_text: str, question: str) -> str:
+    """
+    Syllabus text to send with a question: the top ASK_TOP_K chunks that fit
+    ASK_TOKEN_BUDGET, in document order. Falls back to the full text when it
+    already fits, or when no chunk scores at least ASK_MIN_SCORE.
+    """
+    budget_chars = ASK_TOKEN_BUDGET * 4
+    if len(ocr_text) <= budget_chars:
+        return ocr_text
+    index = _load_chunk_index(text_path, ocr_text)
+    scores = _bm25_scores(index, _terms(question))
+    ranked = sorted(range(len(scores)), key=lambda i: (-scores[i], i))
+    if not ranked or scores[ranked[0]] < ASK_MIN_SCORE:
+        return ocr_text
+    picked, used = [], 0
+    for i in ranked[:ASK_TOP_K]:
+        if scores[i] <= 0:
+            break
+        size = len(index["chunks"][i])
+        if used + size > budget_chars:
+            continue
+        picked.append(i)
+        used += size
+    if not picked:  # ASK_CHUNK_CHARS above the budget: send the best chunk, cut to fit
+        return index["chunks"][ranked[0]][:budget_chars]
+    return "\n...\n".join(index["chunks"][i] for i in sorted(picked))
+
+def _qa_prompt(text_path: str, ocr_text: str, question: str) -> str:
+    return (
+        "You are a helpful assistant answering questions ONLY from the provided syllabus text.\n"
+        "If the answer is not present, say you cannot find it. Keep responses concise.\n"
+        f"SYLLABUS_START\n{select_context(text_path, ocr_text, question)}\nSYLLABUS_END\n\n"
+        f"QUESTION: {question}\n"
+        "ANSWER:"
+    )
+
+def _mock_answer(question: str) -> str:
+    return f"(Demo) Based on the syllabus: {question} → Late penalty is 10%/day up to 3 days; attendance mandatory."
+
+# ===== Answer cache (for /ask) =====
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2000"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.6"))
+
+_NEGATIONS = frozenset({"not", "no", "never", "without", "nor", "cannot"})
+
+def _negations(text: str) -> frozenset:
+    """Negation words in a question; contractions like "isn't" count as "not"."""
+    found = set()
+    for w in re.findall(r"[a-z]+(?:['’]t)?", text.lower()):
+        if w in _NEGATIONS:
+            found.add("not" if w == "cannot" else w)
+        elif w.endswith(("n't", "n’t")):
+            found.add("not")
+    return frozenset(found)
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class AnswerCache:
+    """
+    In-process LRU of answers per syllabus content hash. A lookup first tries
+    the normalized question exactly, then the most similar cached question for
+    the same syllabus: the mean of term and character-trigram Jaccard similarity
+    must reach `threshold`, and any numbers ("HW3", "week 7") and negations
+    ("not", "no", "never", "without") must match exactly. Entries are grouped
+    by syllabus, so the fuzzy scan only covers that syllabus's questions;
+    eviction drops the oldest question of the least recently used syllabus.
+    """
+
+    def __init__(self, max_entries: int, threshold: float):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # syllabus_hash -> OrderedDict(normalized -> (terms, trigrams, numbers, negations, answer))
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _features(question: str):
+        terms = _terms(question)
+        normalized = " ".join(terms)
+        padded = f" {normalized} "
+        trigrams = {padded[i:i + 3] for i in range(len(padded) - 2)}
+        numbers = frozenset(t for t in terms if any(ch.isdigit() for ch in t))
+        return normalized, set(terms), trigrams, numbers, _negations(question)
+
+    def get(self, syllabus_hash: str, question: str):
+        normalized, terms, trigrams, numbers, negations = self._features(question)
+        if self.max_entries <= 0 or not normalized:
+            return None
+        with self._lock:
+            questions = self._entries.get(syllabus_hash)
+            if questions is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(syllabus_hash)
+            if normalized in questions and questions[normalized][3] == negations:
+                questions.move_to_end(normalized)
+                self.hits += 1
+                return questions[normalized][4]
+            best_key, best_sim = None, self.threshold
+            for q, (t2, g2, n2, neg2, _) in questions.items():
+                if n2 != numbers or neg2 != negations:
+                    continue
+                sim = (_jaccard(terms, t2) + _jaccard(trigrams, g2)) / 2
+                if sim >= best_sim:
+                    best_key, best_sim = q, sim
+            if best_key is None:
+                self.misses += 1
+                return None
+            questions.move_to_end(best_key)
+            self.hits += 1
+            self.fuzzy_hits += 1
+            return questions[best_key][4]
+
+    def put(self, syllabus_hash: str, question: str, answer: str):
+        normalized, terms, trigrams, numbers, negations = self._features(question)
+        if self.max_entries <= 0 or not normalized:
+            return
+        with self._lock:
+            questions = self._entries.setdefault(syllabus_hash, OrderedDict())
+            self._entries.move_to_end(syllabus_hash)
+            if normalized not in questions:
+                self._size += 1
+            questions[normalized] = (terms, trigrams, numbers, negations, answer)
+            questions.move_to_end(normalized)
+            while self._size > self.max_entries:
+                oldest = next(iter(self._entries.values()))
+                oldest.popitem(last=False)
+                if not oldest:
+                    self._entries.popitem(last=False)
+                self._size -= 1
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "syllabi": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+ANSWER_CACHE = AnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_THRESHOLD)
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def cached_ocr_text(sha256: str):
+    """OCR text for the PDF with this SHA-256 if it is already in the OCR cache, else None."""
+    if USE_MOCK:
+        return None
+    return OCR_CACHE.get(_ocr_cache_key(None, _ocr_backend(), sha256))
+
+def _page_count(pdf) -> int:
+    """Cheap page count (no rendering); 0 if it can't be determined."""
+    try:
+        if fitz is not None:
+            doc = _open_pdf(pdf)
+            try:
+                return len(doc)
+            finally:
+                doc.close()
+        if isinstance(pdf, str) and pdfinfo_from_path is not None:
+            return int(pdfinfo_from_path(pdf)["Pages"])
+        if pdfinfo_from_bytes is not None:
+            return int(pdfinfo_from_bytes(pdf)["Pages"])
+    except Exception:
+        pass
+    return 0
+
+def process_syllabus(pdf, progress: dict = None, sha256: str = None) -> dict:
+    """
+    Full upload pipeline for a PDF path or bytes: OCR, structured extraction,
+    OCR text persisted to a blob.
+    `progress` is updated in place as stages advance (see ocr_pdf_with_vision stats)
+    so another thread can report it. Returns what the session needs.
+    """
+    if progress is None:
+        progress = {}
+    progress.update(stage="ocr", page_count=_page_count(pdf))
+    ocr_text = ocr_pdf_with_vision(pdf, stats=progress, sha256=sha256)
+    return finish_syllabus(ocr_text, progress)
+
+def finish_syllabus(ocr_text: str, progress: dict = None) -> dict:
+    """The rest of process_syllabus once OCR text exists (also used for cached OCR)."""
+    if progress is None:
+        progress = {}
+    progress["stage"] = "extracting"
+    extraction = {}
+    faq, schedule, summary = extract_structured_with_gemini(ocr_text, stats=extraction)
+    text_path = _save_large_blob("syllabus", ocr_text)
+    save_chunk_index(text_path, ocr_text)
+    progress["stage"] = "done"
+    return {
+        "syllabus_text_path": text_path,
+        "syllabus_hash": _text_hash(ocr_text),
+        "faq": faq,
+        "schedule": schedule,
+        "syllabus_summary": summary,
+        "ocr_stats": {k: v for k, v in progress.items() if k != "stage"},
+        "extraction": extraction,
+    }
+
+def _load_result_into_session(result: dict):
+    """Store a process_syllabus result in the session and flash the usual summary."""
+    # Large OCR text lives in a temp file; only its path goes in the session.
+    session["syllabus_text_path"] = result["syllabus_text_path"]
+    session["syllabus_hash"] = result["syllabus_hash"]
+    # FAQ and schedule go to the session store by reference when the backend supports it.
+    session_put_payload("faq", result["faq"])
+    session_put_payload("schedule", result["schedule"])
+    session["syllabus_summary"] = result["syllabus_summary"]
+
+    schedule = result["schedule"]
+    ocr_stats = result["ocr_stats"]
+    total_weight = sum(float(i.get("weight_pct", 0.0)) for i in schedule)
+    if 90 <= total_weight <= 110:
+        flash(f"OCR + parsing complete. Detected total grading weight ≈ <b>{total_weight:.1f}%</b>.", "success")
+    else:
+        flash(f"OCR + parsing complete. Detected total grading weight ≈ <b>{total_weight:.1f}%</b> (may be incomplete).", "success")
+    extraction = result.get("extraction") or {}
+    if extraction.get("source") == "near_duplicate":
+        flash(
+            f"Policies and schedule reused from a near-identical syllabus "
+            f"({extraction['similarity']:.0%} similar).",
+            "success",
+        )
+    if ocr_stats.get("cached"):
+        flash("OCR result reused from cache.", "success")
+    elif ocr_stats.get("pages"):
+        flash(
+            f"{ocr_stats['text_layer_pages']} of {ocr_stats['pages']} page(s) read from the PDF text layer; "
+            f"{ocr_stats['ocr_pages']} sent to Vision OCR.",
+            "success",
+        )
+
+# ===== Uploads =====
+class UploadSpool:
+    """
+    Disk file that a multipart upload is streamed into while the form is parsed,
+    hashing as it goes, so a request never holds the PDF in memory. Removed when
+    the request closes unless detach()ed.
+    """
+
+    def __init__(self):
+        fd, self.name = tempfile.mkstemp(prefix="upload-", suffix=".pdf")
+        self._file = os.fdopen(fd, "w+b")
+        self._sha256 = hashlib.sha256()
+        self._keep = False
+
+    def write(self, data) -> int:
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+    @property
+    def path(self) -> str:
+        """Path of the complete upload, for opening by name."""
+        self._file.flush()
+        return self.name
+
+    def detach(self) -> str:
+        """Keep the file after the request; the caller owns (and deletes) it."""
+        self._keep = True
+        return self.path
+
+    def close(self):
+        self._file.close()
+        if not self._keep:
+            try:
+                os.remove(self.name)
+            except OSError:
+                pass
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+class SpoolingRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadSpool()
+
+app.request_class = SpoolingRequest
+
+# Resumable uploads: the client sends the PDF's SHA-256 first (POST /uploads) and
+# either gets cached results right away or an upload id to PUT chunks to, resuming
+# from the offset the server reports after a dropped connection.
+UPLOAD_PARTS_DIR = os.path.join(CACHE_DIR, "uploads")
+UPLOAD_CHUNK_BYTES = int(float(os.getenv("UPLOAD_CHUNK_MB", "4")) * 1024 * 1024)
+UPLOAD_PARTS_TTL_SECONDS = int(os.getenv("UPLOAD_PARTS_TTL_SECONDS", str(24 * 3600)))
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_upload_locks = defaultdict(threading.Lock)  # upload id -> lock serializing its chunks
+
+def _part_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_PARTS_DIR, f"{upload_id}.part")
+
+def _prune_partial_uploads():
+    """Delete expired parts, then forget the chunk locks of uploads that no longer exist."""
+    cutoff = time.time() - UPLOAD_PARTS_TTL_SECONDS
+    try:
+        it = os.scandir(UPLOAD_PARTS_DIR)
+    except FileNotFoundError:
+        it = None
+    if it is not None:
+        with it:
+            for e in it:
+                try:
+                    if e.stat().st_mtime < cutoff:
+                        os.remove(e.path)
+                except OSError:
+                    pass
+    for upload_id in list(_upload_locks):
+        if not os.path.exists(_part_path(upload_id)):
+            _upload_locks.pop(upload_id, None)
+
+def begin_chunked_upload(sha256: str, size: int, filename: str) -> str:
+    os.makedirs(UPLOAD_PARTS_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    with open(f"{_part_path(upload_id)}.json", "w", encoding="utf-8") as f:
+        json.dump({"sha256": sha256, "size": size, "filename": filename}, f)
+    open(_part_path(upload_id), "wb").close()
+    return upload_id
+
+def partial_upload(upload_id: str):
+    """Metadata plus bytes received so far for an unfinished upload, or None."""
+    try:
+        with open(f"{_part_path(upload_id)}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["received"] = os.path.getsize(_part_path(upload_id))
+    except (FileNotFoundError, ValueError):
+        return None
+    return meta
+
+def write_chunk(upload_id: str, offset: int, stream, expected_size: int, chunk_sha256: str = None) -> int:
+    """
+    Write one chunk at `offset` from `stream`; return its length. Raises ValueError
+    (and discards the chunk) if it overruns the upload or fails its checksum.
+    """
+    h = hashlib.sha256()
+    written = 0
+    with open(_part_path(upload_id), "r+b") as f:
+        f.seek(offset)
+        try:
+            for block in iter(lambda: stream.read(64 * 1024), b""):
+                written += len(block)
+                if written > UPLOAD_CHUNK_BYTES or offset + written > expected_size:
+                    raise ValueError("Chunk is larger than allowed.")
+                h.update(block)
+                f.write(block)
+            if chunk_sha256 and h.hexdigest() != chunk_sha256:
+                raise ValueError("Chunk checksum mismatch.")
+        except Exception:
+            f.truncate(offset)
+            raise
+    return written
+
+def complete_chunked_upload(upload_id: str, sha256: str) -> str:
+    """Verify the whole file against its SHA-256 and move it out of the parts dir; return its path."""
+    part = _part_path(upload_id)
+    try:
+        if _pdf_sha256(part) != sha256:
+            raise ValueError("Uploaded file does not match its SHA-256.")
+        fd, pdf_path = tempfile.mkstemp(prefix="upload-", suffix=".pdf")
+        os.close(fd)
+        os.replace(part, pdf_path)
+        return pdf_path
+    finally:
+        for path in (part, f"{part}.json"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+# ===== Background jobs =====
+# In-process registry: run gunicorn with one worker and several threads
+# (or sticky sessions) so status polls reach the process that owns the job.
+UPLOAD_ASYNC = os.getenv("UPLOAD_ASYNC", "0") == "1"
+JOB_WORKERS = max(1, int(os.getenv("JOB_WORKERS", "2")))
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_job_pool = None
+_job_pool_pid = None
+
+def _get_job_pool() -> ThreadPoolExecutor:
+    global _job_pool, _job_pool_pid
+    with _jobs_lock:
+        if _job_pool is None or _job_pool_pid != os.getpid():
+            _job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="upload-job")
+            _job_pool_pid = os.getpid()
+        return _job_pool
+
+def _prune_jobs():
+    cutoff = time.time() - JOB_TTL_SECONDS
+    with _jobs_lock:
+        for job_id in [j for j, job in _jobs.items() if job["created"] < cutoff]:
+            job = _jobs.pop(job_id)
+            if job["pdf_path"]:
+                try:
+                    os.remove(job["pdf_path"])
+                except OSError:
+                    pass
+
+def enqueue_upload_job(pdf_path: str, sha256: str = None, ocr_text: str = None) -> str:
+    """
+    Queue process_syllabus for a PDF already stored at pdf_path; return the job id.
+    With ocr_text (cached OCR, no PDF) only the rest of the pipeline runs, via finish_syllabus.
+    """
+    _prune_jobs()
+    job_id = uuid.uuid4().hex
+    with _jobs_lock:
+        _jobs[job_id] = {
+            "id": job_id,
+            "state": "queued",
+            "progress": {"stage": "queued", **({"cached": True} if ocr_text is not None else {})},
+            "error": None,
+            "result": None,
+            "pdf_path": pdf_path,
+            "sha256": sha256,
+            "ocr_text": ocr_text,
+            "created": time.time(),
+        }
+    _get_job_pool().submit(_run_upload_job, job_id)
+    return job_id
+
+def _run_upload_job(job_id: str):
+    job = _jobs.get(job_id)
+    if job is None:
+        return
+    job["state"] = "running"
+    try:
+        if job["ocr_text"] is not None:
+            job["result"] = finish_syllabus(job["ocr_text"], job["progress"])
+        else:
+            job["result"] = process_syllabus(job["pdf_path"], progress=job["progress"], sha256=job["sha256"])
+        job["state"] = "done"
+    except Exception as e:
+        job["error"] = str(e)
+        job["state"] = "error"
+    finally:
+        if job["pdf_path"]:
+            try:
+                os.remove(job["pdf_path"])
+            except OSError:
+                pass
+        job["pdf_path"] = job["ocr_text"] = None
+
+def _job_status(job: dict) -> dict:
+    return {
+        "id": job["id"],
+        "state": job["state"],
+        "progress": dict(job["progress"]),
+        "error": job["error"],
+    }
+
 # ===== Routes =====
 
 @app.route("/", methods=["GET"])
 def index():
-    # --- CHANGED: read OCR text from temp file path stored in session
-    syllabus_text = _read_blob(session.get("syllabus_text_path", ""))
-    return render_template_string(
-        PAGE,
-        faq=session.get("faq"),
-        schedule=session.get("schedule"),
-        syllabus_text=syllabus_text,
+    # OCR text itself is fetched by the OCR pane from /ocr-text when opened
+    text_path = session.get("syllabus_text_path", "")
+    schedule = session_payload("schedule")
+    job_id = session.get("job_id")
+    if job_id and job_id not in _jobs:
+        # Lost to a restart, JOB_TTL_SECONDS or another worker; don't render a job box that can't finish.
+        session.pop("job_id", None)
+        job_id = None
+        flash("Your upload is no longer being processed. Please upload the PDF again.", "error")
+    return render_template(
+        PAGE_TEMPLATE,
+        fragments=dashboard_fragments(session_payload("faq"), schedule),
+        schedule=schedule,
+        chart_v=chart_version(schedule) if schedule else "",
+        has_text=BLOB_STORE.exists(text_path),
         syllabus_summary=session.get("syllabus_summary"),
         answer=session.pop("last_answer", None),
+        job_id=job_id,
         use_mock=USE_MOCK
     )
 
+@app.route("/ocr-text")
+def ocr_text():
+    """A window of OCR pages: ?page=N (1-based) &count=K (at most OCR_TEXT_PAGES_PER_REQUEST)."""
+    page = max(1, request.args.get("page", 1, type=int))
+    count = min(max(1, request.args.get("count", OCR_TEXT_PAGES_PER_REQUEST, type=int)), OCR_TEXT_PAGES_PER_REQUEST)
+    pages, total = read_ocr_pages(session.get("syllabus_text_path", ""), page, count)
+    if not total:
+        return jsonify(error="No OCR text yet."), 404
+    last = page + len(pages) - 1
+    return jsonify(
+        page=page,
+        total_pages=total,
+        pages=pages,
+        next_page=last + 1 if last < total else None,
+    )
+
 @app.route("/upload", methods=["POST"])
 def upload():
     file = request.files.get("pdf")
@@ -614,31 +2804,172 @@ def upload():
         flash("Only PDF files are supported.", "error")
         return redirect(url_for("index"))
 
-    try:
-        pdf_bytes = file.read()
-        ocr_text = ocr_pdf_with_vision(pdf_bytes)
-        faq, schedule, summary = extract_structured_with_gemini(ocr_text)
-
-        # --- CHANGED: persist large OCR text to a temp file; store only the path in session
-        ocr_text_path = _save_large_blob("syllabus", ocr_text)
-        session["syllabus_text_path"] = ocr_text_path
-
-        # Keep small data in session (FAQ, schedule, summary). If they get large, persist similarly.
-        session["faq"] = faq
-        session["schedule"] = schedule
-        session["syllabus_summary"] = summary
-
-        total_weight = sum(float(i.get("weight_pct", 0.0)) for i in schedule)
-        if 90 <= total_weight <= 110:
-            flash(f"OCR + parsing complete. Detected total grading weight ≈ <b>{total_weight:.1f}%</b>.", "success")
-        else:
-            flash(f"OCR + parsing complete. Detected total grading weight ≈ <b>{total_weight:.1f}%</b> (may be incomplete).", "success")
+    spool = file.stream  # an UploadSpool: already on disk and hashed
+    if UPLOAD_ASYNC:
+        job_id = enqueue_upload_job(spool.detach(), sha256=spool.hexdigest())
+        session["job_id"] = job_id
+        if request.accept_mimetypes.best == "application/json":
+            return jsonify(job_id=job_id, status_url=url_for("job_status", job_id=job_id)), 202
+        return redirect(url_for("index"))
 
+    try:
+        _load_result_into_session(process_syllabus(spool.path, sha256=spool.hexdigest()))
     except Exception as e:
         flash(f"Processing failed: {e}", "error")
 
     return redirect(url_for("index"))
 
+@app.route("/uploads", methods=["POST"])
+def upload_precheck():
+    """
+    Start of the resumable protocol. JSON body: {"sha256", "size", "filename"}.
+    Returns {"status": "done"} when OCR for that hash is cached (results are
+    loaded into the session; with UPLOAD_ASYNC, {"status": "queued"} and a job
+    id instead), else an upload id, the offset to resume from and the chunk
+    size to use.
+    """
+    data = request.get_json(silent=True) or {}
+    sha256 = str(data.get("sha256", "")).lower()
+    filename = str(data.get("filename", ""))
+    try:
+        size = int(data.get("size", 0))
+    except (TypeError, ValueError):
+        size = 0
+    if not _SHA256_RE.match(sha256) or size <= 0:
+        return jsonify(error="Send the file's sha256 and size."), 400
+    if not filename.lower().endswith(".pdf"):
+        return jsonify(error="Only PDF files are supported."), 400
+    if size > app.config["MAX_CONTENT_LENGTH"]:
+        return jsonify(error="File is too large."), 413
+
+    ocr_text = cached_ocr_text(sha256)
+    if ocr_text is not None and UPLOAD_ASYNC:
+        # Extraction can still take a while: run it as a job like any other upload.
+        session["job_id"] = enqueue_upload_job(None, sha256=sha256, ocr_text=ocr_text)
+        return jsonify(status="queued", job_id=session["job_id"], redirect=url_for("index")), 202
+    if ocr_text is not None:
+        try:
+            _load_result_into_session(finish_syllabus(ocr_text, {"cached": True}))
+        except Exception as e:
+            flash(f"Processing failed: {e}", "error")
+        return jsonify(status="done", redirect=url_for("index"))
+
+    _prune_partial_uploads()
+    uploads = dict(session.get("uploads") or {})
+    upload_id = next(
+        (u for u, meta in ((u, partial_upload(u)) for u in uploads)
+         if meta and meta["sha256"] == sha256 and meta["size"] == size),
+        None,
+    ) or begin_chunked_upload(sha256, size, filename)
+    uploads = {u: h for u, h in uploads.items() if partial_upload(u)}
+    uploads[upload_id] = sha256
+    session["uploads"] = uploads
+    return jsonify(
+        status="upload",
+        upload_id=upload_id,
+        offset=partial_upload(upload_id)["received"],
+        chunk_size=UPLOAD_CHUNK_BYTES,
+        url=url_for("upload_chunk", upload_id=upload_id),
+    )
+
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+def upload_chunk(upload_id):
+    """
+    Body is the chunk at ?offset=N (which must equal the bytes received so far);
+    an optional X-Chunk-SHA256 header is checked before the chunk is kept. The
+    last chunk verifies the whole file and starts processing like /upload. If
+    that check fails the upload is discarded and the response is 410 with
+    {"status": "restart"}: the client has to start over with POST /uploads.
+    """
+    if upload_id not in (session.get("uploads") or {}):
+        abort(404)
+    with _upload_locks[upload_id]:
+        meta = partial_upload(upload_id)
+        if meta is None:
+            abort(404)
+        offset = request.args.get("offset", -1, type=int)
+        if offset != meta["received"]:
+            return jsonify(error="Offset does not match bytes received.", offset=meta["received"]), 409
+        try:
+            received = offset + write_chunk(
+                upload_id, offset, request.stream, meta["size"],
+                (request.headers.get("X-Chunk-SHA256") or "").lower() or None,
+            )
+        except ValueError as e:
+            return jsonify(error=str(e), offset=offset), 422
+        if received < meta["size"]:
+            return jsonify(status="upload", offset=received)
+
+        uploads = dict(session.get("uploads") or {})
+        uploads.pop(upload_id, None)
+        session["uploads"] = uploads
+        try:
+            pdf_path = complete_chunked_upload(upload_id, meta["sha256"])
+        except ValueError as e:
+            _upload_locks.pop(upload_id, None)
+            return jsonify(status="restart", error=str(e)), 410
+    _upload_locks.pop(upload_id, None)
+
+    if UPLOAD_ASYNC:
+        session["job_id"] = enqueue_upload_job(pdf_path, sha256=meta["sha256"])
+        return jsonify(status="queued", job_id=session["job_id"], redirect=url_for("index")), 202
+    try:
+        _load_result_into_session(process_syllabus(pdf_path, sha256=meta["sha256"]))
+    except Exception as e:
+        flash(f"Processing failed: {e}", "error")
+    finally:
+        try:
+            os.remove(pdf_path)
+        except OSError:
+            pass
+    return jsonify(status="done", redirect=url_for("index"))
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = _jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(_job_status(job))
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """Server-Sent Events: one status message per change until the job finishes."""
+    job = _jobs.get(job_id)
+    if job is None:
+        abort(404)
+
+    def stream():
+        last = None
+        while True:
+            status = json.dumps(_job_status(job))
+            if status != last:
+                yield f"data: {status}\n\n"
+                last = status
+            if job["state"] in ("done", "error"):
+                return
+            time.sleep(0.5)
+
+    return Response(stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route("/jobs/<job_id>/load", methods=["POST"])
+def job_load(job_id):
+    """Move a finished job's results into the session that started it."""
+    job = _jobs.get(job_id)
+    if job is None or session.get("job_id") != job_id:
+        abort(404)
+    if job["state"] == "done":
+        _load_result_into_session(job["result"])
+    elif job["state"] == "error":
+        flash(f"Processing failed: {job['error']}", "error")
+    else:
+        return jsonify(_job_status(job)), 409
+    session.pop("job_id", None)
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+    if request.accept_mimetypes.best == "application/json":
+        return jsonify(ok=True)
+    return redirect(url_for("index"))
+
 @app.route("/ask", methods=["POST"])
 def ask():
     question = request.form.get("question", "").strip()
@@ -647,27 +2978,24 @@ def ask():
         return redirect(url_for("index"))
 
     # --- CHANGED: load OCR text from temp file rather than session blob
-    ocr_text = _read_blob(session.get("syllabus_text_path", ""))
+    text_path = session.get("syllabus_text_path", "")
+    ocr_text = _read_blob(text_path)
 
     if not ocr_text:
         flash("Upload a syllabus first.", "error")
         return redirect(url_for("index"))
 
+    syllabus_hash = session.get("syllabus_hash") or _text_hash(ocr_text)
     try:
-        if USE_MOCK:
-            answer = f"(Demo) Based on the syllabus: {question} → Late penalty is 10%/day up to 3 days; attendance mandatory."
-        else:
-            ensure_genai()
-            model = genai.GenerativeModel("gemini-flash-latest")
-            qa_prompt = (
-                "You are a helpful assistant answering questions ONLY from the provided syllabus text.\n"
-                "If the answer is not present, say you cannot find it. Keep responses concise.\n"
-                f"SYLLABUS_START\n{ocr_text}\nSYLLABUS_END\n\n"
-                f"QUESTION: {question}\n"
-                "ANSWER:"
-            )
-            resp = model.generate_content(qa_prompt)
-            answer = (resp.text or "").strip() or "I couldn't find that in the syllabus."
+        answer = ANSWER_CACHE.get(syllabus_hash, question)
+        if answer is None:
+            if USE_MOCK:
+                answer = _mock_answer(question)
+            else:
+                model = get_gemini_model()
+                resp = model.generate_content(_qa_prompt(text_path, ocr_text, question))
+                answer = (resp.text or "").strip() or "I couldn't find that in the syllabus."
+                ANSWER_CACHE.put(syllabus_hash, question, answer)
 
         session["last_answer"] = answer
     except Exception as e:
@@ -675,62 +3003,597 @@ def ask():
 
     return redirect(url_for("index"))
 
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    """
+    Same as /ask, but relays the answer as Server-Sent Events while Gemini
+    generates it: `data: {"text": ...}` per chunk, then `event: done` (or
+    `event: error`). The answer is not stored in the session; the Ask panel
+    renders it in place.
+    """
+    question = request.form.get("question", "").strip()
+    text_path = session.get("syllabus_text_path", "")
+    ocr_text = _read_blob(text_path)
+    if not question or not ocr_text:
+        abort(400)
+    syllabus_hash = session.get("syllabus_hash") or _text_hash(ocr_text)
+
+    def event(data, name=None):
+        prefix = f"event: {name}\n" if name else ""
+        return f"{prefix}data: {json.dumps(data)}\n\n"
+
+    def stream():
+        try:
+            cached = ANSWER_CACHE.get(syllabus_hash, question)
+            if cached is not None:
+                yield event({"text": cached})
+            elif USE_MOCK:
+                for word in _mock_answer(question).split(" "):
+                    yield event({"text": word + " "})
+            else:
+                model = get_gemini_model()
+                parts = []
+                for chunk in model.generate_content(_qa_prompt(text_path, ocr_text, question), stream=True):
+                    text = chunk.text or ""
+                    if text:
+                        parts.append(text)
+                        yield event({"text": text})
+                answer = "".join(parts).strip()
+                if answer:
+                    ANSWER_CACHE.put(syllabus_hash, question, answer)
+                else:
+                    yield event({"text": "I couldn't find that in the syllabus."})
+            yield event({}, "done")
+        except Exception as e:
+            yield event({"error": f"Q&A failed: {e}"}, "error")
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # ===== Charts (Matplotlib) =====
-@app.route("/chart/weights")
-def chart_weights():
-    schedule = session.get("schedule", [])
+# Rendered charts are cached by a hash of the schedule and chart parameters,
+# which doubles as a strong ETag. The dashboard links charts with ?v=<etag
+# prefix>, so those URLs can be cached by the browser until the schedule changes.
+CHART_FIGSIZE = (7, 3.6)
+CHART_DPI = 160
+CHART_RENDERER = os.getenv("CHART_RENDERER", "png").lower()  # png (Matplotlib) | svg (native)
+CHART_MAX_AGE = int(os.getenv("CHART_MAX_AGE", "86400"))
+CHART_CACHE_MAX_BYTES = int(float(os.getenv("CHART_CACHE_MAX_MB", "32")) * 1024 * 1024)
+
+_chart_cache = OrderedDict()  # key -> png bytes
+_chart_cache_bytes = [0]
+_chart_cache_lock = threading.Lock()
+
+def _chart_key(kind: str, schedule) -> str:
+    payload = json.dumps(
+        {"kind": kind, "schedule": schedule, "figsize": CHART_FIGSIZE, "dpi": CHART_DPI, "renderer": CHART_RENDERER},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def chart_version(schedule) -> str:
+    """Cache-busting ?v= value for chart URLs; changes whenever the schedule does."""
+    return _chart_key("version", schedule)[:16]
+
+def _chart_cache_get(key: str):
+    with _chart_cache_lock:
+        data = _chart_cache.get(key)
+        if data is not None:
+            _chart_cache.move_to_end(key)
+        return data
+
+def _chart_cache_put(key: str, data: bytes):
+    with _chart_cache_lock:
+        if key in _chart_cache:
+            return
+        _chart_cache[key] = data
+        _chart_cache_bytes[0] += len(data)
+        while _chart_cache_bytes[0] > CHART_CACHE_MAX_BYTES and _chart_cache:
+            _, old = _chart_cache.popitem(last=False)
+            _chart_cache_bytes[0] -= len(old)
+
+def _chart_response(kind: str):
+    schedule = session_payload("schedule", [])
     if not schedule:
         return _blank_png()
-
-    weeks, cumulative = compute_cumulative_weights(schedule)
-    import matplotlib
-    matplotlib.use("Agg")
-    import matplotlib.pyplot as plt
-
-    fig, ax = plt.subplots(figsize=(7, 3.6))
-    ax.plot(weeks, cumulative, marker="o")
+    key = _chart_key(kind, schedule)
+    if request.if_none_match.contains(key):
+        resp = Response(status=304)
+    else:
+        data = _chart_cache_get(key)
+        if data is None:
+            data = CHART_RENDERERS[CHART_RENDERER][kind](schedule)
+            _chart_cache_put(key, data)
+        resp = Response(data, mimetype=CHART_MIMETYPES[CHART_RENDERER])
+    resp.set_etag(key)
+    resp.cache_control.private = True
+    if request.args.get("v") == chart_version(schedule):
+        resp.cache_control.max_age = CHART_MAX_AGE
+    else:
+        resp.cache_control.no_cache = True  # unversioned URL: always revalidate
+    return resp
+
+# Matplotlib charts use the object-oriented Figure/FigureCanvasAgg API, never
+# pyplot's global state. Each chart kind keeps a small pool of pre-built
+# figures; a request checks one out, updates its artists in place, renders,
+# and returns it, so concurrent requests render in parallel without a lock.
+CHART_POOL_SIZE = int(os.getenv("CHART_POOL_SIZE", "4"))
+_figure_pools = {"weights": queue.LifoQueue(), "assignments": queue.LifoQueue()}
+
+def _initial_layout(fig) -> dict:
+    p = fig.subplotpars
+    return {"left": p.left, "right": p.right, "bottom": p.bottom, "top": p.top}
+
+def _build_weights_figure() -> dict:
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=CHART_FIGSIZE)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    (line,) = ax.plot([], [], marker="o")
     ax.set_xlabel("Week")
     ax.set_ylabel("Cumulative % of Final Grade")
     ax.set_title("Cumulative Grade Allocation by Week")
     ax.grid(True, which="both", linestyle="--", alpha=0.3)
-    fig.tight_layout()
+    return {"fig": fig, "ax": ax, "line": line, "layout": _initial_layout(fig)}
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", dpi=160, bbox_inches="tight")
-    plt.close(fig)
-    buf.seek(0)
-    return send_file(buf, mimetype="image/png")
+def _build_assignments_figure() -> dict:
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
 
-@app.route("/chart/assignments")
-def chart_assignments():
-    schedule = session.get("schedule", [])
-    if not schedule:
-        return _blank_png()
-
-    weeks, counts = compute_assignments_by_week(schedule)
-    import matplotlib
-    matplotlib.use("Agg")
-    import matplotlib.pyplot as plt
-
-    fig, ax = plt.subplots(figsize=(7, 3.6))
-    ax.bar(weeks, counts)
+    fig = Figure(figsize=CHART_FIGSIZE)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
     ax.set_xlabel("Week")
     ax.set_ylabel("# Assignments")
     ax.set_title("Assignments per Week")
     ax.grid(axis="y", linestyle="--", alpha=0.3)
-    fig.tight_layout()
+    ax.set_axisbelow(True)
+    return {"fig": fig, "ax": ax, "bars": [], "layout": _initial_layout(fig)}
+
+def _render_pooled(kind: str, build, update) -> bytes:
+    pool = _figure_pools[kind]
+    try:
+        state = pool.get_nowait()
+    except queue.Empty:
+        state = build()
+    try:
+        update(state)
+        # tight_layout starts from the current layout; reset it so reused figures render identically
+        state["fig"].subplots_adjust(**state["layout"])
+        state["fig"].tight_layout()
+        buf = io.BytesIO()
+        state["fig"].savefig(buf, format="png", dpi=CHART_DPI, bbox_inches="tight")
+        return buf.getvalue()
+    finally:
+        if pool.qsize() < CHART_POOL_SIZE:
+            pool.put(state)
+
+def _render_weights_png(schedule) -> bytes:
+    weeks, cumulative = compute_cumulative_weights(schedule)
+
+    def update(state):
+        state["line"].set_data(weeks, cumulative)
+        state["ax"].relim()
+        state["ax"].autoscale_view()
 
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", dpi=160, bbox_inches="tight")
-    plt.close(fig)
-    buf.seek(0)
-    return send_file(buf, mimetype="image/png")
+    return _render_pooled("weights", _build_weights_figure, update)
+
+def _render_assignments_png(schedule) -> bytes:
+    weeks, counts = compute_assignments_by_week(schedule)
+
+    def update(state):
+        from matplotlib.patches import Rectangle
+
+        ax, bars = state["ax"], state["bars"]
+        while len(bars) < len(weeks):
+            bars.append(ax.add_patch(Rectangle((0, 0), 0.8, 0, facecolor="C0")))
+        while len(bars) > len(weeks):
+            bars.pop().remove()
+        for rect, week, count in zip(bars, weeks, counts):
+            rect.set_xy((week - 0.4, 0))
+            rect.set_height(count)
+        ax.relim()
+        ax.autoscale_view()
+        ax.set_ylim(0, max(max(counts), 1) * 1.05)
+
+    return _render_pooled("assignments", _build_assignments_figure, update)
+
+# Native SVG charts: no Matplotlib import or rasterization. Colors follow the
+# PAGE theme variables, including the light scheme via prefers-color-scheme;
+# presentation attributes carry the dark theme for viewers that ignore <style>.
+SVG_W, SVG_H = int(CHART_FIGSIZE[0] * 100), int(CHART_FIGSIZE[1] * 100)
+SVG_MARGIN = {"left": 64, "right": 18, "top": 40, "bottom": 50}
+SVG_STYLE = """
+text{font:12px Inter,ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,Arial;fill:#93a3b8}
+.title{font-size:15px;font-weight:700;fill:#e5e7eb}
+.label{font-size:13px;fill:#e5e7eb}
+.grid{stroke:#1e293b;stroke-dasharray:4 3}
+.axis{stroke:#93a3b8}
+.line{fill:none;stroke:#22d3ee;stroke-width:2.2}
+.dot{fill:#22d3ee}
+.bar{fill:#3b82f6}
+@media (prefers-color-scheme: light){
+  text{fill:#5b6b7f} .title,.label{fill:#0b1220} .grid{stroke:#e5e7eb} .axis{stroke:#5b6b7f}
+}
+"""
+
+def _nice_ticks(lo: float, hi: float, target: int = 5, integer: bool = False) -> list:
+    """Round tick values covering [lo, hi] with steps of 1, 2 or 5 × 10^n."""
+    if hi <= lo:
+        hi = lo + 1
+    raw = (hi - lo) / target
+    mag = 10 ** math.floor(math.log10(raw))
+    step = next(m * mag for m in (1, 2, 5, 10) if m * mag >= raw)
+    if integer:
+        step = max(1, round(step))
+    start = math.floor(lo / step) * step
+    ticks = []
+    v = start
+    while v < hi + step * 0.999:
+        ticks.append(round(v, 10))
+        v += step
+    return ticks
+
+def _fmt_tick(v: float) -> str:
+    return f"{v:g}"
+
+def _svg_chart(title: str, ylabel: str, weeks: list, values: list, kind: str) -> bytes:
+    """One line ("line") or bar ("bar") series over week numbers, drawn as SVG."""
+    left, right = SVG_MARGIN["left"], SVG_W - SVG_MARGIN["right"]
+    top, bottom = SVG_MARGIN["top"], SVG_H - SVG_MARGIN["bottom"]
+    pad = 0.6 if kind == "bar" else 0.3
+    x_lo, x_hi = min(weeks) - pad, max(weeks) + pad
+    y_ticks = _nice_ticks(0.0, max(max(values), 1), integer=kind == "bar")
+    y_hi = y_ticks[-1]
+    x_ticks = [
+        w for w in _nice_ticks(min(weeks), max(weeks), target=min(12, len(weeks)), integer=True)
+        if x_lo <= w <= x_hi
+    ]
+
+    def sx(x):
+        return left + (x - x_lo) / (x_hi - x_lo) * (right - left)
+
+    def sy(y):
+        return bottom - y / y_hi * (bottom - top)
+
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {SVG_W} {SVG_H}" width="{SVG_W}" height="{SVG_H}">',
+        f"<style>{SVG_STYLE}</style>",
+        '<g fill="#93a3b8" stroke-width="1">',
+        f'<text class="title" x="{(left + right) / 2:.1f}" y="24" text-anchor="middle">{html.escape(title)}</text>',
+    ]
+    for y in y_ticks:
+        out.append(f'<line class="grid" stroke="#1e293b" stroke-dasharray="4 3" x1="{left}" x2="{right}" y1="{sy(y):.1f}" y2="{sy(y):.1f}"/>')
+        out.append(f'<text x="{left - 8}" y="{sy(y) + 4:.1f}" text-anchor="end">{_fmt_tick(y)}</text>')
+    for x in x_ticks:
+        if kind == "line":
+            out.append(f'<line class="grid" stroke="#1e293b" stroke-dasharray="4 3" x1="{sx(x):.1f}" x2="{sx(x):.1f}" y1="{top}" y2="{bottom}"/>')
+        out.append(f'<text x="{sx(x):.1f}" y="{bottom + 18}" text-anchor="middle">{_fmt_tick(x)}</text>')
+
+    if kind == "bar":
+        half = 0.4 * (right - left) / (x_hi - x_lo)
+        for w, v in zip(weeks, values):
+            out.append(
+                f'<rect class="bar" fill="#3b82f6" x="{sx(w) - half:.1f}" y="{sy(v):.1f}" width="{2 * half:.1f}" height="{bottom - sy(v):.1f}">'
+                f"<title>Week {w}: {_fmt_tick(v)}</title></rect>"
+            )
+    else:
+        points = " ".join(f"{sx(w):.1f},{sy(v):.1f}" for w, v in zip(weeks, values))
+        out.append(f'<polyline class="line" fill="none" stroke="#22d3ee" points="{points}"/>')
+        for w, v in zip(weeks, values):
+            out.append(f'<circle class="dot" fill="#22d3ee" cx="{sx(w):.1f}" cy="{sy(v):.1f}" r="3.5"><title>Week {w}: {_fmt_tick(v)}</title></circle>')
+
+    out += [
+        f'<line class="axis" stroke="#93a3b8" x1="{left}" x2="{right}" y1="{bottom}" y2="{bottom}"/>',
+        f'<line class="axis" stroke="#93a3b8" x1="{left}" x2="{left}" y1="{top}" y2="{bottom}"/>',
+        f'<text class="label" x="{(left + right) / 2:.1f}" y="{SVG_H - 10}" text-anchor="middle">Week</text>',
+        f'<text class="label" transform="translate(16 {(top + bottom) / 2:.1f}) rotate(-90)" text-anchor="middle">{html.escape(ylabel)}</text>',
+        "</g>",
+        "</svg>",
+    ]
+    return "\n".join(out).encode("utf-8")
+
+def _render_weights_svg(schedule) -> bytes:
+    weeks, cumulative = compute_cumulative_weights(schedule)
+    return _svg_chart("Cumulative Grade Allocation by Week", "Cumulative % of Final Grade", weeks, cumulative, "line")
+
+def _render_assignments_svg(schedule) -> bytes:
+    weeks, counts = compute_assignments_by_week(schedule)
+    return _svg_chart("Assignments per Week", "# Assignments", weeks, counts, "bar")
+
+CHART_RENDERERS = {
+    "png": {"weights": _render_weights_png, "assignments": _render_assignments_png},
+    "svg": {"weights": _render_weights_svg, "assignments": _render_assignments_svg},
+}
+CHART_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+if CHART_RENDERER not in CHART_RENDERERS:
+    raise RuntimeError(f"CHART_RENDERER must be one of {sorted(CHART_RENDERERS)}, got {CHART_RENDERER!r}.")
+
+@app.route("/chart/weights")
+def chart_weights():
+    return _chart_response("weights")
+
+@app.route("/chart/assignments")
+def chart_assignments():
+    return _chart_response("assignments")
+
+@app.route("/stats")
+def stats():
+    """Cache counters for this worker process."""
+    return jsonify(
+        ocr_cache=OCR_CACHE.stats(),
+        extract_cache=EXTRACT_CACHE.stats(),
+        answer_cache=ANSWER_CACHE.stats(),
+        chart_cache={"entries": len(_chart_cache), "bytes": _chart_cache_bytes[0]},
+        fragment_cache={"entries": len(_fragment_cache)},
+        blob_store=BLOB_STORE.stats(),
+        near_dup=NEAR_DUP_INDEX.stats(),
+    )
 
 def _blank_png():
     """Return a tiny transparent PNG placeholder."""
     pixel = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mP8/x8AAuMBgMc1A8kAAAAASUVORK5CYII=")
     return send_file(io.BytesIO(pixel), mimetype="image/png")
 
+# ===== CLI (flask --app app <command>) =====
+@app.cli.group("ocr-cache")
+def ocr_cache_cli():
+    """Inspect or invalidate the OCR result cache."""
+
+@ocr_cache_cli.command("stats")
+def ocr_cache_stats():
+    click.echo(json.dumps(OCR_CACHE.stats(), indent=2))
+
+@ocr_cache_cli.command("clear")
+@click.option("--sha256", "digest", default="", help="Only drop entries for the PDF with this SHA-256.")
+def ocr_cache_clear(digest):
+    removed = OCR_CACHE.clear(prefix=digest.lower())
+    click.echo(f"Removed {removed} cached OCR result(s).")
+
+@app.cli.group("extract-cache")
+def extract_cache_cli():
+    """Inspect or invalidate the Gemini extraction cache."""
+
+@extract_cache_cli.command("stats")
+def extract_cache_stats():
+    click.echo(json.dumps(dict(EXTRACT_CACHE.stats(), prompt_version=EXTRACTION_PROMPT_VERSION), indent=2))
+
+@extract_cache_cli.command("clear")
+def extract_cache_clear():
+    removed = EXTRACT_CACHE.clear()
+    click.echo(f"Removed {removed} cached extraction(s).")
+
+@app.cli.group("blob-store")
+def blob_store_cli():
+    """Inspect or collect the OCR text blob store."""
+
+@blob_store_cli.command("stats")
+def blob_store_stats():
+    click.echo(json.dumps(BLOB_STORE.stats(), indent=2))
+
+@blob_store_cli.command("gc")
+def blob_store_gc():
+    result = BLOB_STORE.gc()
+    click.echo(f"Removed {result['removed']} file(s), reclaimed {result['reclaimed_bytes']} bytes.")
+
+@app.cli.group("near-dup")
+def near_dup_cli():
+    """Inspect or reset the near-duplicate extraction index."""
+
+@near_dup_cli.command("stats")
+def near_dup_stats():
+    click.echo(json.dumps(NEAR_DUP_INDEX.stats(), indent=2))
+
+@near_dup_cli.command("clear")
+def near_dup_clear():
+    removed = NEAR_DUP_INDEX.clear()
+    click.echo(f"Removed {removed} indexed extraction(s).")
+
+# Variants are FORMAT/DPI[/QUALITY][/gray][/adaptive], e.g. "jpeg/150/70/gray".
+BENCH_ENCODING_VARIANTS = [
+    "png/200/gray",
+    "png/150/gray",
+    "jpeg/200/85",
+    "jpeg/200/85/gray",
+    "jpeg/150/75/gray",
+    "webp/150/80/gray",
+    "jpeg/200/80/gray/adaptive",
+]
+
+def _parse_encoding_variant(spec: str) -> dict:
+    parts = spec.lower().split("/")
+    encoding = dict(OCR_ENCODING, format=parts[0], grayscale=False, adaptive_dpi=False)
+    numbers = [int(p) for p in parts[1:] if p.isdigit()]
+    if numbers:
+        encoding["dpi"] = numbers[0]
+    if len(numbers) > 1:
+        encoding["quality"] = numbers[1]
+    encoding["grayscale"] = "gray" in parts
+    encoding["adaptive_dpi"] = "adaptive" in parts
+    if encoding["format"] not in ("png", "jpeg", "webp"):
+        raise click.BadParameter(f"Unknown image format in {spec!r}.")
+    return encoding
+
+@app.cli.command("bench-ocr-encoding")
+@click.argument("pdf_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--variant", "variants", multiple=True, help="FORMAT/DPI[/QUALITY][/gray][/adaptive]; repeatable.")
+@click.option("--ocr/--no-ocr", default=True, help="OCR each variant and compare text with the baseline.")
+def bench_ocr_encoding(pdf_path, variants, ocr):
+    """
+    Compare page encodings against the 200-DPI PNG baseline: bytes per page,
+    render+encode time per page and OCR text similarity (difflib ratio).
+    Every page is rendered, including ones the text layer would have served.
+    """
+    baseline = dict(OCR_ENCODING, format="png", dpi=200, grayscale=False, adaptive_dpi=False)
+    runs = [("baseline", baseline)] + [(v, _parse_encoding_variant(v)) for v in (variants or BENCH_ENCODING_VARIANTS)]
+    if ocr and (vision is None or USE_MOCK):
+        click.echo("Vision unavailable; skipping OCR similarity.")
+        ocr = False
+    client = get_vision_client() if ocr else None
+
+    baseline_text = None
+    click.echo(f"{'variant':<28}{'KB/page':>10}{'ms/page':>10}{'similarity':>12}")
+    for name, encoding in runs:
+        images = []
+        start = time.perf_counter()
+        for idx, _, img_bytes in _iter_pages(pdf_path, encoding, text_layer=False):
+            images.append((idx, img_bytes))
+        elapsed = time.perf_counter() - start
+        n = max(1, len(images))
+        similarity = "-"
+        if client is not None:
+            text = "\n".join(_ocr_image(client, idx, img) for idx, img in images)
+            if baseline_text is None:
+                baseline_text = text
+            similarity = f"{difflib.SequenceMatcher(None, baseline_text, text).ratio():.3f}"
+        kb = sum(len(img) for _, img in images) / n / 1024
+        click.echo(f"{_encoding_tag(encoding):<28}{kb:>10.1f}{elapsed / n * 1000:>10.1f}{similarity:>12}")
+
+@app.cli.command("bench-charts")
+@click.option("--weeks", default=15, show_default=True, help="Weeks in the synthetic schedule.")
+@click.option("--repeat", default=10, show_default=True, help="Renders per chart and renderer.")
+def bench_charts(weeks, repeat):
+    """Compare Matplotlib PNG and native SVG charts: mean render time and response size."""
+    schedule = [
+        {"week": w, "assignments": 1 + w % 3, "weight_pct": 100 / weeks, "notes": ""}
+        for w in range(1, weeks + 1)
+    ]
+    click.echo(f"{'chart':<14}{'renderer':<10}{'ms/render':>11}{'bytes':>10}")
+    for kind in ("weights", "assignments"):
+        for renderer in ("png", "svg"):
+            render = CHART_RENDERERS[renderer][kind]
+            render(schedule)  # first call pays imports / font cache
+            start = time.perf_counter()
+            for _ in range(repeat):
+                data = render(schedule)
+            elapsed = (time.perf_counter() - start) / repeat
+            click.echo(f"{kind:<14}{renderer:<10}{elapsed * 1000:>11.2f}{len(data):>10}")
+
+class _RateLimiter:
+    """Spaces calls to wait() at least 60/per_minute seconds apart across threads."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(start - now)
+
+def _ingest_one(path: str, limiter: _RateLimiter) -> dict:
+    record = {"path": path}
+    started = time.perf_counter()
+    try:
+        # Hashed inside the try so an unreadable file (e.g. a dangling symlink) is recorded, not fatal.
+        record["sha256"] = _pdf_sha256(path)
+        limiter.wait()
+        started = time.perf_counter()
+        stats = {}
+        ocr_text = ocr_pdf_with_vision(path, stats=stats, sha256=record["sha256"])
+        ocr_done = time.perf_counter()
+        extraction = {}
+        faq, schedule, summary = extract_structured_with_gemini(ocr_text, stats=extraction)
+        done = time.perf_counter()
+        record.update(
+            status="ok",
+            pages=_page_count(path),
+            ocr=stats,
+            extraction=extraction,
+            faq=faq,
+            schedule=schedule,
+            summary=summary,
+            timings={
+                "ocr_s": round(ocr_done - started, 3),
+                "extract_s": round(done - ocr_done, 3),
+                "total_s": round(done - started, 3),
+            },
+        )
+    except Exception as e:
+        record.update(status="error", error=str(e), timings={"total_s": round(time.perf_counter() - started, 3)})
+    return record
+
+@app.cli.command("ingest")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--out", "out_path", default="ingest.jsonl", show_default=True, type=click.Path(dir_okay=False),
+              help="JSONL file to append results to; PDFs already recorded as ok are skipped.")
+@click.option("--workers", default=4, show_default=True, help="Syllabi processed in parallel.")
+@click.option("--per-minute", default=0.0, help="Start at most this many syllabi per minute (0 = unlimited).")
+@click.option("--recursive/--no-recursive", default=True, show_default=True)
+def ingest(directory, out_path, workers, per_minute, recursive):
+    """
+    Batch-process every PDF under DIRECTORY (OCR + extraction) and append one
+    JSON record per file to --out. Interrupted runs resume where they stopped;
+    results also warm the OCR and extraction caches used by /upload.
+    """
+    if recursive:
+        paths = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+    else:
+        paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+    paths = sorted(p for p in paths if p.lower().endswith(".pdf"))
+
+    done = set()
+    if os.path.exists(out_path):
+        with open(out_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                if record.get("status") == "ok":
+                    done.add(record["path"])
+    todo = [p for p in paths if p not in done]
+    click.echo(f"{len(paths)} PDF(s) found, {len(paths) - len(todo)} already done, {len(todo)} to process.")
+
+    limiter = _RateLimiter(per_minute)
+    ok = failed = pages = reused = 0
+    started = time.perf_counter()
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ingest")
+    try:
+        with open(out_path, "a", encoding="utf-8") as out:
+            futures = [pool.submit(_ingest_one, p, limiter) for p in todo]
+            for n, fut in enumerate(as_completed(futures), start=1):
+                record = fut.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                if record["status"] == "ok":
+                    ok += 1
+                    pages += record["pages"]
+                    reused += record["extraction"].get("source") == "near_duplicate"
+                else:
+                    failed += 1
+                    click.echo(f"FAILED {record['path']}: {record['error']}", err=True)
+                click.echo(f"[{n}/{len(todo)}] {record['status']:<5} {record['timings']['total_s']:>7.1f}s  {record['path']}")
+    except KeyboardInterrupt:
+        click.echo("Interrupted; rerun the same command to resume.", err=True)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+        minutes = (time.perf_counter() - started) / 60 or 1e-9
+        click.echo(
+            f"\n{ok} ok, {failed} failed in {minutes * 60:.1f}s: "
+            f"{ok / minutes:.1f} docs/min, {pages / minutes:.1f} pages/min, "
+            f"{reused} extraction(s) reused from near-duplicates"
+        )
+
+@app.cli.command("warmup")
+def warmup_command():
+    """Create the Gemini and Vision clients once, to check credentials."""
+    warmup()
+    click.echo("Clients ready." if _clients else "No clients created (mock mode or missing configuration).")
+
+if os.getenv("WARMUP_ON_START", "0") == "1":
+    threading.Thread(target=warmup, name="warmup", daemon=True).start()
+
 # ===== Main =====
 if __name__ == "__main__":
     if USE_MOCK: